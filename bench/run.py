@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""Benchmark the overhead of IdioTest itself.
+
+Generates synthetic test suites of different sizes and measures each
+phase of a test run: scanning, loading, selecting tests, spawning
+processes, capturing output, comparing output, and reporting results
+to the console.  The results are written as JSON, with keys sorted,
+so results from different commits can be compared directly.
+
+Usage: bench/run.py [-o FILE] [--sizes 10,1000,50000]
+"""
+from __future__ import with_statement
+import os
+import sys
+import json
+import shutil
+import platform
+import tempfile
+import optparse
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import idiotest.run
+import idiotest.env
+import idiotest.suite
+import idiotest.sglob
+import idiotest.console
+import idiotest.proc
+import idiotest.timing
+
+clock = idiotest.timing.clock
+
+TESTS_PER_MODULE = 10
+
+MODULE = '''\
+@test
+def test_pass():
+    pass
+
+@test("test skip")
+def test_skip():
+    skip()
+
+@test(fail=True)
+def test_fail():
+    fail("expected")
+'''
+
+def generate(root, size):
+    """Generate a suite with 'size' tests in total."""
+    nmodules = max(1, size // TESTS_PER_MODULE)
+    per = size // nmodules
+    for i in xrange(nmodules):
+        dirpath = os.path.join(root, 'd%03d' % (i // 100))
+        if not os.path.isdir(dirpath):
+            os.mkdir(dirpath)
+        fp = open(os.path.join(dirpath, 'm%05d.py' % i), 'w')
+        try:
+            fp.write(MODULE)
+            for j in xrange(per - 3):
+                fp.write('@test\ndef t%d():\n    pass\n' % j)
+        finally:
+            fp.close()
+
+class Quiet(object):
+    """Redirect stdout to nowhere while benchmarking console output."""
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+    def __exit__(self, exc_type, exc_value, traceback):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+def timed(func, *args):
+    start = clock()
+    result = func(*args)
+    return clock() - start, result
+
+def bench_suite(size):
+    """Benchmark the harness phases on a synthetic suite."""
+    result = {}
+    root = tempfile.mkdtemp(prefix='idiotest-bench-')
+    try:
+        generate(root, size)
+        options, args = idiotest.run.parse_args([])
+        env = idiotest.env.make_env(options)
+        suite = idiotest.suite.Suite(root)
+        result['scan'], _ = timed(suite.scan)
+        names = []
+        def load():
+            for module in suite.modules:
+                with module.context():
+                    for test in module.load(env):
+                        names.append(test.fullname)
+        result['load'], _ = timed(load)
+        def collect():
+            for module in suite.modules:
+                module.collect()
+        result['collect'], _ = timed(collect)
+        pats = names[::2]
+        def select():
+            glob = idiotest.sglob.SGlob(pats)
+            for name in names:
+                glob.prefix_match(name)
+        result['filter'], _ = timed(select)
+        def report():
+            with Quiet():
+                obj = idiotest.console.ConsoleTest(None)
+                suite.run(obj, env)
+                obj.print_summary()
+        result['console'], _ = timed(report)
+        result['tests'] = len(names)
+        result['modules'] = len(suite.modules)
+        env['proc'].close()
+    finally:
+        shutil.rmtree(root)
+    return result
+
+def expect_failure(func, *args, **kw):
+    try:
+        func(*args, **kw)
+    except idiotest.proc.ProcFailure:
+        return
+    raise Exception('expected failure')
+
+def bench_proc(count):
+    """Benchmark running processes and checking their output."""
+    result = {}
+    options, args = idiotest.run.parse_args([])
+    proc = idiotest.proc.ProcRunner(options)
+    def spawn():
+        for i in xrange(count):
+            proc.run(['true'])
+    t, _ = timed(spawn)
+    result['spawn_true'] = t / count
+    size = 16 * 1024 * 1024
+    t, output = timed(proc.get_output, ['head', '-c', str(size), '/dev/zero'])
+    result['capture_16m'] = t
+    text = ''.join(['line %d of the output\n' % i for i in xrange(200000)])
+    p = proc.run(['cat'], input=text)
+    result['compare_equal'], _ = timed(p.check_output, text)
+    lines = text.splitlines(True)
+    lines[1000] = 'changed\n'
+    lines[150000] = 'changed\n'
+    changed = ''.join(lines)
+    result['compare_mismatch'], _ = timed(
+        expect_failure, p.check_output, changed)
+    lines = lines[:2000]
+    small = ''.join(lines)
+    for i in xrange(0, len(lines), 100):
+        lines[i] = 'changed\n'
+    p = proc.run(['cat'], input=small)
+    result['compare_mismatch_small'], _ = timed(
+        expect_failure, p.check_output, ''.join(lines))
+    blob = os.urandom(size // 4)
+    p = proc.run(['cat'], input=blob)
+    pos = len(blob) // 2
+    result['compare_mismatch_binary'], _ = timed(
+        expect_failure, p.check_output, blob[:pos] + '\x00' + blob[pos+1:])
+    proc.close()
+    return result
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-o', '--output', dest='output',
+                      help='write results to FILE', metavar='FILE')
+    parser.add_option('--sizes', dest='sizes', default='10,1000,50000',
+                      help='comma-separated list of suite sizes')
+    parser.add_option('--spawn-count', dest='spawn_count', type='int',
+                      default=200, help='number of processes to spawn')
+    options, args = parser.parse_args()
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'suites': {},
+    }
+    for size in [int(x) for x in options.sizes.split(',')]:
+        sys.stderr.write('suite size %d...\n' % (size,))
+        results['suites'][str(size)] = bench_suite(size)
+    sys.stderr.write('processes...\n')
+    results['proc'] = bench_proc(options.spawn_count)
+    data = json.dumps(results, sort_keys=True, indent=2,
+                      separators=(',', ': ')) + '\n'
+    if options.output:
+        fp = open(options.output, 'w')
+        try:
+            fp.write(data)
+        finally:
+            fp.close()
+    else:
+        sys.stdout.write(data)
+
+if __name__ == '__main__':
+    main()
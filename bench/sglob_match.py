@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""Benchmark SGlob matching as the number of patterns grows.
+
+The matching cost per name should stay flat as patterns are added.
+"""
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import idiotest.sglob
+
+def names(n):
+    return ['mod%d.sub.test_%d' % (i % 100, i) for i in xrange(n)]
+
+def bench(npats, nnames=10000):
+    pats = names(npats) + ['mod%d.test_*' % i for i in xrange(npats // 100)]
+    glob = idiotest.sglob.SGlob(pats)
+    targets = names(nnames)
+    start = time.time()
+    for name in targets:
+        glob.prefix_match(name)
+        glob.full_match(name)
+    return (time.time() - start) / nnames
+
+def main():
+    print '%10s %14s' % ('patterns', 'us per name')
+    for npats in (10, 100, 1000, 10000, 100000):
+        print '%10d %14.2f' % (npats, bench(npats) * 1e6)
+
+if __name__ == '__main__':
+    main()
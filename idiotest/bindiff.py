@@ -0,0 +1,117 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest binary output comparison.
+
+Large outputs which are not text are compared as bytes.  The first
+differences are found by comparing fixed-size chunks through
+memoryview objects, so the data is never split into lines or copied,
+and each difference is shown as a hex dump of the bytes around it.
+"""
+from __future__ import absolute_import
+import codecs
+
+CHUNK = 64 * 1024
+
+# Streams larger than this are shown as hex dumps
+LIMIT = 64 * 1024
+
+def is_text(data):
+    """Test whether a byte string is UTF-8 text without NUL bytes."""
+    if '\x00' in data:
+        return False
+    decoder = codecs.getincrementaldecoder('UTF-8')()
+    view = memoryview(data)
+    try:
+        for pos in xrange(0, len(data), CHUNK):
+            decoder.decode(view[pos:pos+CHUNK].tobytes())
+        decoder.decode('', True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def first_difference(a, b, start=0):
+    """Find the first offset at or after 'start' where a and b differ.
+
+    If one string is a prefix of the other, they differ at the end of
+    the shorter string.  Returns None if there is no difference.
+    """
+    n = min(len(a), len(b))
+    ma = memoryview(a)
+    mb = memoryview(b)
+    pos = start
+    while pos < n:
+        end = min(pos + CHUNK, n)
+        if ma[pos:end] != mb[pos:end]:
+            # Bisect the chunk to find the first differing byte
+            lo, hi = pos, end
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if ma[lo:mid] != mb[lo:mid]:
+                    hi = mid
+                else:
+                    lo = mid
+            return lo
+        pos = end
+    if len(a) != len(b) and start <= n:
+        return n
+    return None
+
+def differences(a, b, count, skip):
+    """Find the offsets of up to 'count' differences between a and b.
+
+    After each difference, the next 'skip' bytes are not examined.
+    """
+    result = []
+    pos = 0
+    while len(result) < count:
+        pos = first_difference(a, b, pos)
+        if pos is None:
+            break
+        result.append(pos)
+        pos += skip
+    return result
+
+def hexdump(data, start, end, file, indent='  ', base=0):
+    """Write a hex dump of data[start:end], 16 bytes per line.
+
+    The offsets shown are relative to 'base'.
+    """
+    end = min(end, len(data))
+    for pos in xrange(start, end, 16):
+        line = data[pos:min(pos + 16, end)]
+        hexpart = ' '.join(['%02x' % ord(c) for c in line])
+        text = ''.join([c if ' ' <= c <= '~' else '.' for c in line])
+        file.write(u'%s%08x  %-47s  |%s|\n' %
+                   (indent, base + pos, hexpart, text))
+
+def dump(data, file, size=256):
+    """Write the start of a large binary stream as a hex dump."""
+    file.write(u'<binary, %d bytes>\n' % len(data))
+    hexdump(data, 0, size, file)
+    if len(data) > size:
+        file.write(u'  ... %d more bytes\n' % (len(data) - size))
+
+def write_diff(expected, output, file, count=3, context=32):
+    """Write a description of the differences between two byte strings.
+
+    At most 'count' differences are shown, each with 'context' bytes
+    of data before and after the difference.
+    """
+    file.write(u'=== binary diff ===\n')
+    if len(expected) != len(output):
+        file.write(u'expected %d bytes, got %d bytes\n' %
+                   (len(expected), len(output)))
+    for pos in differences(expected, output, count, context * 2):
+        start = max(0, pos - context) & ~15
+        end = pos + context
+        file.write(u'difference at offset %d (0x%x):\n' % (pos, pos))
+        file.write(u' expected:\n')
+        if start < len(expected):
+            hexdump(expected, start, end, file)
+        else:
+            file.write(u'  <end of stream>\n')
+        file.write(u' got:\n')
+        if start < len(output):
+            hexdump(output, start, end, file)
+        else:
+            file.write(u'  <end of stream>\n')
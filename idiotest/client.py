@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest daemon client.
+
+Usage: python -m idiotest.client SOCKET [OPTIONS] [TESTS]
+
+Runs tests using the daemon listening on SOCKET, which was started
+with '[test.py] --daemon SOCKET'.  The options and tests are the same
+as for [test.py].  This module imports as little as possible, so it
+starts quickly.
+"""
+import os
+import sys
+import json
+import socket
+
+def encode(value):
+    return value.decode('latin-1')
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        sys.stderr.write('usage: python -m idiotest.client SOCKET '
+                         '[OPTIONS] [TESTS]\n')
+        return 2
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(argv[0])
+    request = {
+        'argv': [encode(arg) for arg in argv[1:]],
+        'cwd': encode(os.getcwd()),
+        'env': dict((encode(key), encode(value))
+                    for key, value in os.environ.items()),
+    }
+    sock.sendall(json.dumps(request) + '\n')
+    rfile = sock.makefile('rb')
+    files = {'out': sys.stdout, 'err': sys.stderr}
+    while True:
+        header = rfile.readline()
+        if not header:
+            sys.stderr.write('daemon closed the connection\n')
+            return 1
+        kind, size = header.split()
+        size = int(size)
+        if kind == 'exit':
+            return size
+        f = files[kind]
+        f.write(rfile.read(size))
+        f.flush()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest static test discovery.
+
+Test modules are parsed, but not executed, to find the names of the
+tests they register.  The following forms are recognized when they
+appear at the top level of a module:
+
+    @test
+    @test(**kw)
+    @test("name", **kw)
+    def func(): ...
+
+    test("name", obj, **kw)
+
+If the name 'test' is used in any other way, or if the module uses
+'golden_dir', the tests are considered dynamic and the module must be
+executed to find them.
+"""
+from __future__ import with_statement, absolute_import
+import ast
+import os
+import sys
+import traceback
+import idiotest.exception
+
+TestException = idiotest.exception.TestException
+
+# Map from path to ((mtime, size), names)
+_cache = {}
+
+def _literal_name(args):
+    """Get the test name from decorator arguments, or None."""
+    if not args:
+        return ''
+    if len(args) == 1 and isinstance(args[0], ast.Str):
+        return args[0].s
+    return None
+
+def _decorator_name(deco, defname):
+    """Get the test name for a decorator, or None if it is not 'test'."""
+    if isinstance(deco, ast.Name) and deco.id == 'test':
+        return defname
+    if (isinstance(deco, ast.Call) and isinstance(deco.func, ast.Name)
+        and deco.func.id == 'test'):
+        name = _literal_name(deco.args)
+        if name == '':
+            return defname
+        return name
+    return None
+
+def _call_name(stmt):
+    """Get the test name for a top-level 'test(name, obj)' call, or None."""
+    if not isinstance(stmt, ast.Expr):
+        return None
+    call = stmt.value
+    if (isinstance(call, ast.Call) and isinstance(call.func, ast.Name)
+        and call.func.id == 'test' and len(call.args) == 2
+        and isinstance(call.args[0], ast.Str)):
+        return call.args[0].s
+    return None
+
+def collect_source(source, filename='<string>'):
+    """Find the names of tests registered in module source code.
+
+    Returns a list of names, or None if the tests cannot be found
+    without executing the module.
+    """
+    tree = compile(source, filename, 'exec', ast.PyCF_ONLY_AST)
+    names = []
+    found = 0
+    for stmt in tree.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            for deco in stmt.decorator_list:
+                name = _decorator_name(deco, stmt.name)
+                if name is not None:
+                    names.append(name)
+                    found += 1
+        else:
+            name = _call_name(stmt)
+            if name is not None:
+                names.append(name)
+                found += 1
+    uses = 0
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == 'golden_dir':
+            return None
+        if isinstance(node, ast.Name) and node.id == 'test':
+            if not isinstance(node.ctx, ast.Load):
+                return None
+            uses += 1
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            if node.name == 'test':
+                return None
+    if uses != found:
+        return None
+    return names
+
+def collect_file(path):
+    """Find the names of tests registered in a module file.
+
+    Returns a list of names, or None if the tests cannot be found
+    without executing the module.  Results are cached until the file
+    changes.
+    """
+    st = os.stat(path)
+    key = st.st_mtime, st.st_size
+    try:
+        ckey, names = _cache[path]
+    except KeyError:
+        pass
+    else:
+        if ckey == key:
+            return names
+    fp = open(path, 'rU')
+    try:
+        source = fp.read()
+    finally:
+        fp.close()
+    try:
+        names = collect_source(source, path)
+    except SyntaxError:
+        names = None
+    _cache[path] = key, names
+    return names
+
+def collect_module(module, env):
+    """Get the names of the tests in a module.
+
+    The module is executed only if its tests cannot be found
+    statically.  Raises TestException if the module fails or skips.
+    """
+    names = module.collect()
+    if names is not None:
+        return names
+    with module.context():
+        return [test.name for test in module.load(env)]
+
+def list_tests(suite, env, filter, file=None):
+    """Print the full names of tests in the suite which match the filter."""
+    if file is None:
+        file = sys.stdout
+    for module in suite.modules:
+        if filter is not None and not filter.prefix_match(module.name):
+            continue
+        try:
+            names = collect_module(module, env)
+        except KeyboardInterrupt:
+            raise
+        except TestException, ex:
+            sys.stderr.write('%s: module %s\n' % (
+                module.name, 'skipped' if ex.skip else 'failed'))
+            continue
+        except:
+            sys.stderr.write('%s: module failed\n' % (module.name,))
+            sys.stderr.write(traceback.format_exc())
+            continue
+        for name in names:
+            fullname = '%s.%s' % (module.name, name)
+            if filter is None or filter.prefix_match(fullname):
+                file.write(fullname + '\n')
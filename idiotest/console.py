@@ -2,7 +2,8 @@
 # See LICENSE.txt for details.
 from __future__ import absolute_import
 import sys
-import idiotest.suite as suite
+import idiotest.suite
+import idiotest.journal
 
 BOLD = 1
 
@@ -43,14 +44,35 @@ def print_reason(reason, indent=0):
 def const_true(x):
     return True
 
+def module_selected(filter, module):
+    """Test whether any tests in a module would be selected by a filter.
+
+    The filter is a function which tests a module or test name.
+    """
+    if not filter(module.name):
+        return False
+    if filter is const_true:
+        return True
+    # Avoid loading modules where no tests would run
+    names = module.collect()
+    if names is None:
+        return True
+    for name in names:
+        if filter('%s.%s' % (module.name, name)):
+            return True
+    return False
+
 class ConsoleTest(object):
-    def __init__(self, filter):
+    def __init__(self, filter, durations=0):
         self.module = None
         self.npass = 0
         self.nskip = 0
         self.nfail = 0
         self.failures = []
         self.partial_line = False
+        self.durations = durations
+        self.timed_modules = []
+        self.timed_tests = []
         if filter is not None:
             self.filter = filter.prefix_match
         else:
@@ -66,9 +88,11 @@ class ConsoleTest(object):
         self.mpass = 0
         self.mskip = 0
         self.mfail = 0
-        return self.filter(module.name)
+        return module_selected(self.filter, module)
 
     def module_end(self, module):
+        if self.durations and module.timing.start is not None:
+            self.timed_modules.append(module)
         if self.mfail:
             self.failures.append((module, self.mfail))
         self.npass += self.mpass
@@ -101,6 +125,11 @@ class ConsoleTest(object):
         self.partial_line = True
         return self.filter(test.fullname)
 
+    def test_end(self, test):
+        if self.durations:
+            self.timed_tests.append(test)
+        self.partial_line = False
+
     def test_pass(self, test):
         if not test.fail:
             print box(6, "ok", FG_GREEN)
@@ -108,7 +137,7 @@ class ConsoleTest(object):
         else:
             print box(6, "PASSED", FG_RED, BOLD), '(expected failure)'
             self.mfail += 1
-        self.partial_line = False
+        self.test_end(test)
 
     def test_fail(self, test, reason):
         if not test.fail:
@@ -118,7 +147,7 @@ class ConsoleTest(object):
             print box(6, 'failed', FG_GREEN), '(as expected)'
             self.mpass += 1
         print_reason(reason, 4)
-        self.partial_line = False
+        self.test_end(test)
 
     def test_skip(self, test, reason):
         print box(6, 'skip', FG_BLUE)
@@ -126,7 +155,27 @@ class ConsoleTest(object):
         self.mskip += 1
         self.partial_line = False
 
+    def print_durations(self):
+        n = self.durations
+        def total(obj):
+            return obj.timing.total
+        modules = sorted(self.timed_modules, key=total, reverse=True)[:n]
+        tests = sorted(self.timed_tests, key=total, reverse=True)[:n]
+        for title, objs in (('modules', modules), ('tests', tests)):
+            if not objs:
+                continue
+            print 'slowest %s:' % (title,)
+            for obj in objs:
+                name = getattr(obj, 'fullname', obj.name)
+                print '  %8.3fs  %s' % (obj.timing.total, name)
+                summary = obj.timing.summary()
+                if summary:
+                    print '             (%s)' % (summary,)
+        print
+
     def print_summary(self):
+        if self.durations:
+            self.print_durations()
         print 'tests passed: %d' % (self.npass,)
         if self.nskip:
             print 'tests skipped: %d' % (self.nskip,)
@@ -141,9 +190,24 @@ class ConsoleTest(object):
     def success(self):
         return self.nfail == 0
 
-def run_suite(suite, env, filter):
-    obj = ConsoleTest(filter)
-    suite.run(obj, env)
+def run_suite(suite, env, filter, durations=0, observers=(), passed=()):
+    """Run a test suite and print the results to the console.
+
+    The observers are additional callback objects which receive the
+    results.  Each observer's 'print_summary' method is called after
+    the suite finishes.  Tests named in 'passed' are reported as
+    passing without running them again.
+    """
+    obj = ConsoleTest(filter, durations)
+    if observers:
+        target = idiotest.suite.Broadcast([obj] + list(observers))
+    else:
+        target = obj
+    if passed:
+        target = idiotest.journal.Resume(target, passed)
+    suite.run(target, env)
+    for observer in observers:
+        observer.print_summary()
     obj.print_summary()
     if obj.success():
         sys.exit(0)
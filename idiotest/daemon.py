@@ -0,0 +1,216 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest daemon.
+
+The daemon keeps a test suite loaded behind a Unix socket, so tests
+can be run without paying for interpreter startup, imports, scanning
+the suite, and compiling the test modules every time.  Each request
+runs in a child process forked from the daemon, so a test run cannot
+disturb the daemon's state.  Requests are handled one at a time.
+
+Before each request, the daemon checks whether files were added to or
+removed from the suite's directories, rescanning if necessary, and
+recompiles any test modules which have changed.  Changes to IdioTest
+itself require restarting the daemon.
+
+The client sends a single line of JSON with the command-line
+arguments, the working directory, and the environment.  Strings are
+sent as Latin-1 so arbitrary bytes survive the trip.  The daemon
+replies with a sequence of frames, each starting with a header line.
+The header 'out N' or 'err N' is followed by N bytes of output, and
+the header 'exit N' ends the reply with the exit status.  See
+idiotest.client for the client.
+"""
+from __future__ import absolute_import
+import os
+import sys
+import json
+import errno
+import select
+import signal
+import socket
+import traceback
+import idiotest.suite
+import idiotest.collect
+import idiotest.run
+
+def listen(path):
+    """Listen on a Unix socket, removing a stale socket if present."""
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            os.unlink(path)
+        else:
+            raise Exception('daemon already running: %s' % (path,))
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(16)
+    return sock
+
+def decode(value):
+    return value.encode('latin-1')
+
+def exit_code(code):
+    """Get the exit status for a SystemExit code."""
+    if code is None:
+        return 0
+    if isinstance(code, (int, long)):
+        return code
+    sys.stderr.write('%s\n' % (code,))
+    return 1
+
+def exit_status(status):
+    """Get the exit status for a status from os.waitpid."""
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+class Daemon(object):
+    """A test suite kept loaded between test runs."""
+
+    def __init__(self, root, exec_paths):
+        self.root = os.path.abspath(root)
+        self.exec_paths = [os.path.abspath(path) for path in exec_paths]
+        self.suite = None
+        self.dirs = {}
+
+    def scan(self):
+        """Scan the suite and record the directories' modification times."""
+        suite = idiotest.suite.Suite(self.root)
+        suite.scan()
+        dirs = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [x for x in dirnames if not x.startswith('.')]
+            dirs[dirpath] = os.stat(dirpath).st_mtime
+        self.suite = suite
+        self.dirs = dirs
+
+    def changed(self):
+        """Test whether files were added to or removed from the suite."""
+        for path, mtime in self.dirs.iteritems():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def refresh(self):
+        """Bring the loaded suite up to date with the files on disk."""
+        if self.suite is None or self.changed():
+            self.scan()
+        for module in self.suite.modules:
+            # Errors are reported when the module runs
+            try:
+                idiotest.suite.compile_file(module.path)
+            except (SyntaxError, TypeError, EnvironmentError):
+                pass
+            try:
+                idiotest.collect.collect_file(module.path)
+            except EnvironmentError:
+                pass
+
+    def handle(self, conn):
+        """Handle a single request from a client."""
+        request = json.loads(conn.makefile('rb').readline())
+        self.refresh()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        outr, outw = os.pipe()
+        errr, errw = os.pipe()
+        pid = os.fork()
+        if not pid:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.close(outr)
+            os.close(errr)
+            conn.close()
+            os.dup2(outw, 1)
+            os.dup2(errw, 2)
+            os.close(outw)
+            os.close(errw)
+            self.child(request)
+        os.close(outw)
+        os.close(errw)
+        streams = {outr: 'out', errr: 'err'}
+        try:
+            while streams:
+                ready, _, _ = select.select(list(streams), [], [])
+                for fd in ready:
+                    data = os.read(fd, 65536)
+                    if data:
+                        conn.sendall('%s %d\n%s' % (streams[fd], len(data),
+                                                    data))
+                    else:
+                        os.close(fd)
+                        del streams[fd]
+        except socket.error:
+            # The client went away
+            os.kill(pid, signal.SIGTERM)
+            for fd in streams:
+                os.close(fd)
+            os.waitpid(pid, 0)
+            return
+        pid, status = os.waitpid(pid, 0)
+        conn.sendall('exit %d\n' % (exit_status(status),))
+
+    def child(self, request):
+        """Run a test suite in the child process, and exit."""
+        status = 1
+        try:
+            try:
+                os.chdir(decode(request['cwd']))
+                os.environ.clear()
+                for key, value in request['env'].iteritems():
+                    os.environ[decode(key)] = decode(value)
+                argv = [decode(arg) for arg in request['argv']]
+                options, args = idiotest.run.parse_args(argv, self.exec_paths)
+                if options.daemon:
+                    raise Exception('daemon cannot be started by a client')
+                idiotest.run.run_options(options, args, self.root,
+                                         self.suite)
+                status = 0
+            except SystemExit, ex:
+                status = exit_code(ex.code)
+            except:
+                traceback.print_exc()
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+def terminate(signum, frame):
+    sys.exit(0)
+
+def serve(path, root, exec_paths=()):
+    """Serve test runs for the suite in 'root' on a Unix socket.
+
+    The daemon runs until it is interrupted or terminated.
+    """
+    daemon = Daemon(root, exec_paths)
+    daemon.refresh()
+    server = listen(path)
+    sys.stderr.write('daemon listening on %s\n' % (path,))
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        while True:
+            try:
+                conn, addr = server.accept()
+            except socket.error, ex:
+                if ex.errno == errno.EINTR:
+                    continue
+                raise
+            try:
+                daemon.handle(conn)
+            except (socket.error, ValueError, KeyError):
+                traceback.print_exc()
+            finally:
+                conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(path)
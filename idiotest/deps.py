@@ -0,0 +1,144 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest test dependencies.
+
+While tests run, the ProcRunner records the files each test uses: the
+executables it runs, including the wrapper, files given as program
+input or reference output, and program arguments which name existing
+files.  Files used by a fixture are dependencies of every test which
+uses the fixture.  The test module itself is also a dependency of
+each of its tests.  The dependencies are saved as a JSON object mapping test names
+to lists of absolute paths.
+
+Given a list of changed paths, the tests affected by the change are
+the tests which depend on one of the paths, or on a file inside one
+of the paths if it is a directory, and the tests with no recorded
+dependencies.
+"""
+from __future__ import absolute_import
+import os
+import sys
+import json
+import idiotest.suite
+
+def realpath(path):
+    return os.path.realpath(os.path.abspath(path))
+
+def load(path):
+    """Load dependencies from a file, or return {} if it does not exist."""
+    try:
+        fp = open(path, 'rb')
+    except IOError:
+        return {}
+    try:
+        return json.load(fp)
+    finally:
+        fp.close()
+
+def save(path, deps):
+    """Save dependencies to a file, replacing it atomically."""
+    tmppath = path + '.tmp'
+    fp = open(tmppath, 'wb')
+    try:
+        json.dump(deps, fp, sort_keys=True, indent=1,
+                  separators=(',', ': '))
+        fp.write('\n')
+    finally:
+        fp.close()
+    os.rename(tmppath, path)
+
+def read_paths(values, stdin=None):
+    """Get the changed paths from --affected-by option values.
+
+    Each value is a list of paths separated by os.pathsep, or '-' to
+    read paths from stdin, one per line.
+    """
+    paths = []
+    for value in values:
+        if value == '-':
+            if stdin is None:
+                stdin = sys.stdin
+            paths.extend([line.strip() for line in stdin])
+        else:
+            paths.extend(value.split(os.pathsep))
+    return [realpath(path) for path in paths if path]
+
+def test_paths(usage, test):
+    """Remove and return the files a test used from a usage map.
+
+    The files used by the test's fixtures are included.
+    """
+    paths = usage.pop(test.fullname, set())
+    fixtures = getattr(test.module, 'fixtures', None)
+    params = getattr(test, 'params', None)
+    if fixtures is not None and params:
+        paths.update(fixtures.files(params))
+    return paths
+
+class Recorder(idiotest.suite.Callback):
+    """Callback object which records the dependencies of each test.
+
+    The 'usage' is the map from test names to sets of paths which is
+    filled in by the ProcRunner.  Call 'close' to save the results.
+    """
+
+    def __init__(self, path, deps, usage):
+        self.path = path
+        self.deps = deps
+        self.usage = usage
+
+    def test_end(self, test):
+        paths = test_paths(self.usage, test)
+        if test.timing.start is None:
+            return
+        paths.add(realpath(test.module.path))
+        name = test.fullname
+        if not isinstance(name, unicode):
+            name = name.decode('UTF-8', 'replace')
+        self.deps[name] = sorted(paths)
+    def test_pass(self, test):
+        self.test_end(test)
+    def test_skip(self, test, reason):
+        self.test_end(test)
+    def test_fail(self, test, reason):
+        self.test_end(test)
+
+    def print_summary(self):
+        pass
+
+    def close(self):
+        save(self.path, self.deps)
+
+class Affected(object):
+    """A filter which selects the tests affected by changed paths.
+
+    Only names selected by 'filter' are selected, unless 'filter' is
+    None.
+    """
+
+    def __init__(self, deps, paths, filter=None):
+        self.filter = filter
+        changed = set(paths)
+        self.known = set()
+        self.affected = set()
+        for name, depends in deps.iteritems():
+            self.known.add(name)
+            for path in depends:
+                if self.is_changed(changed, path):
+                    self.affected.add(name)
+                    break
+
+    @staticmethod
+    def is_changed(changed, path):
+        while True:
+            if path in changed:
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def prefix_match(self, name):
+        if self.filter is not None and not self.filter.prefix_match(name):
+            return False
+        return name in self.affected or name not in self.known
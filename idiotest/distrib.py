@@ -0,0 +1,476 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest distributed execution.
+
+A coordinator serves the modules of a test suite to any number of
+workers over TCP.  Each worker has its own copy of the test suite,
+asks the coordinator for a module, runs it, and streams the callback
+events back.  The coordinator replays the events into its own
+callback object in module order, so the console output looks the same
+as a local run.  If a worker disconnects before it finishes a module,
+the module is given to another worker, up to ATTEMPTS times in all,
+after which the module fails.  If all workers disconnect and none
+connect again within IDLE_TIMEOUT seconds, the modules which have
+not finished fail.
+
+The coordinator selects the modules and tests to run, so every
+selection option, including --affected-by and --resume, applies to
+the workers.  The workers send the files each test used and the CPU
+time of its child processes along with the results.
+
+The protocol is newline-delimited JSON.  The coordinator sends a
+'hello' message, then 'run' messages naming modules, and finally
+'quit'.  The worker replies to each 'run' with a sequence of event
+messages ending with a 'done' message.  After each 'module_begin' and
+'test_begin' event, the worker waits for a 'select' message which
+says whether to run the module or test.
+"""
+from __future__ import absolute_import
+import collections
+import json
+import socket
+import sys
+import threading
+import time
+import idiotest.console
+import idiotest.deps
+import idiotest.history
+import idiotest.journal
+import idiotest.suite
+import idiotest.timing
+
+PROTOCOL_VERSION = 2
+
+# Number of times a module is tried before it fails
+ATTEMPTS = 3
+
+# Seconds to wait for workers after the last one disconnects
+IDLE_TIMEOUT = 5.0
+
+def parse_address(address):
+    """Parse a 'HOST:PORT' string."""
+    host, sep, port = address.rpartition(':')
+    if not sep:
+        raise ValueError('invalid address, expected HOST:PORT: %r' %
+                         (address,))
+    return host or '0.0.0.0', int(port)
+
+def text(value):
+    """Convert a reason to unicode for sending."""
+    if value is None or isinstance(value, unicode):
+        return value
+    return value.decode('UTF-8', 'replace')
+
+TIMING_FIELDS = ['start', 'end', 'load', 'spawn', 'child', 'compare', 'nproc']
+
+def dump_timing(timing):
+    return dict((name, getattr(timing, name)) for name in TIMING_FIELDS)
+
+def load_timing(data):
+    timing = idiotest.timing.Timing()
+    for name in TIMING_FIELDS:
+        setattr(timing, name, data[name])
+    return timing
+
+class Connection(object):
+    """A connection which sends and receives JSON messages."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self.wfile = sock.makefile('wb')
+
+    def send(self, msg):
+        self.wfile.write(json.dumps(msg) + '\n')
+        self.wfile.flush()
+
+    def recv(self):
+        """Receive a message, or raise EOFError if the peer is gone."""
+        line = self.rfile.readline()
+        if not line:
+            raise EOFError()
+        return json.loads(line)
+
+    def close(self):
+        for obj in (self.rfile, self.wfile, self.sock):
+            try:
+                obj.close()
+            except socket.error:
+                pass
+
+########################################################################
+# Worker
+
+class Recorder(object):
+    """Callback object which sends events to the coordinator.
+
+    The files each test uses are taken from 'usage', the map filled in
+    by the ProcRunner, unless it is None.
+    """
+
+    def __init__(self, conn, usage):
+        self.conn = conn
+        self.usage = usage
+        self.cpu = None
+
+    def selected(self):
+        """Wait for the coordinator to say whether to run something."""
+        msg = self.conn.recv()
+        if msg.get('op') != 'select':
+            raise Exception('unexpected message from coordinator: %r' %
+                            (msg,))
+        return msg['selected']
+
+    def module_begin(self, module):
+        self.conn.send({'event': 'module_begin'})
+        return self.selected()
+    def module_pass(self, module):
+        self.module_end('module_pass', module, None)
+    def module_skip(self, module, reason):
+        self.module_end('module_skip', module, reason)
+    def module_fail(self, module, reason):
+        self.module_end('module_fail', module, reason)
+    def module_end(self, event, module, reason):
+        self.conn.send({'event': event, 'reason': text(reason),
+                        'timing': dump_timing(module.timing)})
+
+    def test_begin(self, test):
+        self.conn.send({'event': 'test_begin', 'name': test.name,
+                        'fail': test.fail})
+        self.cpu = idiotest.history.child_cpu()
+        return self.selected()
+    def test_pass(self, test):
+        self.test_end('test_pass', test, None)
+    def test_skip(self, test, reason):
+        self.test_end('test_skip', test, reason)
+    def test_fail(self, test, reason):
+        self.test_end('test_fail', test, reason)
+    def test_end(self, event, test, reason):
+        msg = {'event': event, 'reason': text(reason),
+               'timing': dump_timing(test.timing),
+               'cpu': idiotest.history.child_cpu() - self.cpu}
+        if self.usage is not None:
+            msg['deps'] = sorted(idiotest.deps.test_paths(self.usage, test))
+        self.conn.send(msg)
+
+def connect(address, timeout=30.0):
+    """Connect to the coordinator, retrying until it is listening."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return socket.create_connection(address)
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+def run_worker(suite, env, address):
+    """Run modules for a coordinator until it tells us to quit."""
+    conn = Connection(connect(parse_address(address)))
+    modules = dict((module.name, module) for module in suite.modules)
+    session = suite.session(env)
+    try:
+        msg = conn.recv()
+        if msg.get('op') != 'hello' or msg.get('version') != PROTOCOL_VERSION:
+            raise Exception('unexpected message from coordinator: %r' %
+                            (msg,))
+        proc = env['proc']
+        if msg['deps'] and proc.usage is None:
+            proc.usage = {}
+        obj = Recorder(conn, proc.usage if msg['deps'] else None)
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                break
+            op = msg.get('op')
+            if op == 'quit':
+                break
+            if op != 'run':
+                raise Exception('unexpected message from coordinator: %r' %
+                                (msg,))
+            try:
+                module = modules[msg['module']]
+            except KeyError:
+                raise Exception('module not found: %r' % (msg['module'],))
+            module.run(obj, env, session)
+            conn.send({'event': 'done'})
+    finally:
+        error = session.close()
+        if error is not None:
+            sys.stderr.write(error.encode('UTF-8') + '\n')
+        conn.close()
+
+########################################################################
+# Coordinator
+
+class RemoteModule(object):
+    """A module which ran on a worker."""
+    def __init__(self, module):
+        self.name = module.name
+        self.path = module.path
+        self.timing = idiotest.timing.Timing()
+    def collect(self):
+        return None
+
+class RemoteTest(object):
+    """A test which ran on a worker."""
+    def __init__(self, module, name, fail):
+        self.module = module
+        self.name = name
+        self.fail = fail
+        self.timing = idiotest.timing.Timing()
+        self.cpu = None
+    @property
+    def fullname(self):
+        return '%s.%s' % (self.module.name, self.name)
+
+def failure_events(events, reason):
+    """Get the events for a module which could not finish.
+
+    The 'events' are the ones received before the worker went away.
+    """
+    events = list(events)
+    if not events:
+        events.append({'event': 'module_begin'})
+    events.append({'event': 'module_fail', 'reason': reason,
+                   'timing': dump_timing(idiotest.timing.Timing())})
+    return events
+
+def replay(obj, module, events, usage=None):
+    """Pass the events from running a module to a callback object.
+
+    The files each test used are added to 'usage', unless it is None.
+    """
+    rmodule = RemoteModule(module)
+    test = None
+    for event in events:
+        kind = event['event']
+        if kind == 'module_begin':
+            obj.module_begin(rmodule)
+        elif kind == 'test_begin':
+            test = RemoteTest(rmodule, event['name'], event['fail'])
+            obj.test_begin(test)
+        elif kind.startswith('test_'):
+            test.timing = load_timing(event['timing'])
+            test.cpu = event['cpu']
+            if usage is not None and 'deps' in event:
+                usage[test.fullname] = set(event['deps'])
+            if kind == 'test_pass':
+                obj.test_pass(test)
+            else:
+                getattr(obj, kind)(test, event['reason'])
+        else:
+            rmodule.timing = load_timing(event['timing'])
+            if kind == 'module_pass':
+                obj.module_pass(rmodule)
+            else:
+                getattr(obj, kind)(rmodule, event['reason'])
+
+class Coordinator(object):
+    """Serves modules to workers and collects their results."""
+
+    def __init__(self, suite, filter, address, passed=(), deps=False):
+        self.modules = suite.modules
+        self.hello = {'op': 'hello', 'version': PROTOCOL_VERSION,
+                      'deps': deps}
+        if filter is not None:
+            self.filter = filter.prefix_match
+        else:
+            self.filter = idiotest.console.const_true
+        self.passed = passed
+        self.pending = collections.deque(range(len(self.modules)))
+        self.results = [None] * len(self.modules)
+        self.attempts = [0] * len(self.modules)
+        self.cond = threading.Condition()
+        self.finished = False
+        self.nworkers = 0
+        # Time when the last worker disconnected, or None
+        self.idle_since = None
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(parse_address(address))
+        self.server.listen(64)
+        self.address = self.server.getsockname()
+
+    def start(self):
+        thread = threading.Thread(target=self.accept_loop)
+        thread.setDaemon(True)
+        thread.start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                sock, addr = self.server.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=self.handle, args=(sock,))
+            thread.setDaemon(True)
+            thread.start()
+
+    def next_module(self):
+        """Get the index of the next module to run, or None if done."""
+        self.cond.acquire()
+        try:
+            while not self.pending:
+                if self.finished:
+                    return None
+                self.cond.wait(1.0)
+            return self.pending.popleft()
+        finally:
+            self.cond.release()
+
+    def handle(self, sock):
+        """Give modules to a worker until there are none left."""
+        conn = Connection(sock)
+        self.cond.acquire()
+        self.nworkers += 1
+        self.idle_since = None
+        self.cond.release()
+        index = None
+        events = []
+        reason = u'worker disconnected'
+        try:
+            conn.send(self.hello)
+            while True:
+                index = self.next_module()
+                if index is None:
+                    conn.send({'op': 'quit'})
+                    break
+                conn.send({'op': 'run', 'module': self.modules[index].name})
+                module = self.modules[index]
+                events = []
+                while True:
+                    msg = conn.recv()
+                    kind = msg['event']
+                    if kind == 'done':
+                        break
+                    events.append(msg)
+                    if kind == 'module_begin':
+                        selected = idiotest.console.module_selected(
+                            self.filter, module)
+                    elif kind == 'test_begin':
+                        selected = self.test_selected(
+                            '%s.%s' % (module.name, msg['name']))
+                    else:
+                        continue
+                    conn.send({'op': 'select', 'selected': selected})
+                self.cond.acquire()
+                try:
+                    self.results[index] = events
+                    index = None
+                    self.cond.notifyAll()
+                finally:
+                    self.cond.release()
+        except EOFError:
+            reason = u'worker exited'
+        except (socket.error, ValueError, KeyError), ex:
+            reason = u'worker connection failed: %s' % (text(str(ex)),)
+        finally:
+            conn.close()
+            self.cond.acquire()
+            try:
+                self.nworkers -= 1
+                if not self.nworkers:
+                    self.idle_since = time.time()
+                if index is not None:
+                    self.worker_lost(index, events, reason)
+                self.cond.notifyAll()
+            finally:
+                self.cond.release()
+
+    def test_selected(self, name):
+        """Test whether a worker should run a test.
+
+        Tests which passed in an earlier run are not run again.  They
+        are reported as passing by journal.Resume.
+        """
+        return self.filter(name) and name not in self.passed
+
+    def worker_lost(self, index, events, reason):
+        """Handle a worker which went away while running a module.
+
+        The module is given to another worker, or fails if it has been
+        tried too many times.  Must be called with the lock held.
+        """
+        self.attempts[index] += 1
+        if events and events[-1]['event'] == 'test_begin':
+            reason += u" while running test '%s'" % (events[-1]['name'],)
+        if self.attempts[index] < ATTEMPTS:
+            self.pending.appendleft(index)
+            return
+        reason += u' (tried %d times)' % (self.attempts[index],)
+        self.results[index] = failure_events(events, reason)
+
+    def fail_unfinished(self, reason):
+        """Fail every module which has not finished.
+
+        Must be called with the lock held.
+        """
+        self.pending.clear()
+        for index, events in enumerate(self.results):
+            if events is None:
+                self.results[index] = failure_events([], reason)
+
+    def wait_result(self, index):
+        self.cond.acquire()
+        try:
+            while self.results[index] is None:
+                if (not self.nworkers and self.idle_since is not None and
+                    time.time() - self.idle_since > IDLE_TIMEOUT):
+                    self.fail_unfinished(u'no workers connected')
+                    break
+                self.cond.wait(1.0)
+            events = self.results[index]
+            self.results[index] = ()
+            return events
+        finally:
+            self.cond.release()
+
+    def run(self, obj, usage=None):
+        """Replay the results from all modules, in order, into obj."""
+        for index, module in enumerate(self.modules):
+            replay(obj, module, self.wait_result(index), usage)
+        self.cond.acquire()
+        try:
+            self.finished = True
+            self.cond.notifyAll()
+            # Give the workers a chance to receive 'quit'
+            deadline = time.time() + 5.0
+            while self.nworkers and time.time() < deadline:
+                self.cond.wait(0.1)
+        finally:
+            self.cond.release()
+
+    def close(self):
+        self.server.close()
+
+def run_coordinator(suite, filter, address, durations=0, observers=(),
+                    passed=(), usage=None):
+    """Serve a test suite to workers and print the results.
+
+    The 'observers' and 'passed' are the same as for
+    console.run_suite.  If 'usage' is not None, the workers record the
+    files each test uses and they are added to 'usage'.
+    """
+    coord = Coordinator(suite, filter, address, passed, usage is not None)
+    sys.stderr.write('coordinator listening on %s:%d\n' % coord.address)
+    coord.start()
+    obj = idiotest.console.ConsoleTest(filter, durations)
+    if observers:
+        target = idiotest.suite.Broadcast([obj] + list(observers))
+    else:
+        target = obj
+    if passed:
+        target = idiotest.journal.Resume(target, passed)
+    try:
+        coord.run(target, usage)
+    finally:
+        coord.close()
+    for observer in observers:
+        observer.print_summary()
+    obj.print_summary()
+    if obj.success():
+        sys.exit(0)
+    else:
+        sys.exit(1)
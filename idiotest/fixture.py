@@ -0,0 +1,433 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest fixtures.
+
+A fixture is a function which prepares something tests need, such as
+a large input file or a running helper program.  Tests ask for
+fixtures by naming them as parameters.  Fixtures are evaluated the
+first time a test which runs asks for them, and the value is kept for
+the rest of the fixture's scope: either the module which registered
+it, or the whole test session.
+
+If a fixture is a generator, the value is the first item it yields,
+and the rest of the generator is run to tear the fixture down when
+its scope ends.  Teardown runs even if the tests fail.
+
+Session fixtures which several modules use should be defined in a
+fixture file, named 'conftest.py', anywhere in the suite.  Fixture
+files are loaded before any module runs, so their fixtures can be
+found no matter which modules are selected.  A session fixture
+registered by a test module can only be used after that module runs.
+
+Fixtures with 'cache=True' are saved on disk, keyed by the fixture's
+code and the contents of the files listed in 'inputs', and on the
+same things for the fixtures it uses, so the setup only runs again
+when one of those changes.  The value must be
+picklable.
+
+The files which programs run by a fixture use are recorded on the
+fixture, and count as dependencies of every test which uses the
+fixture (see idiotest.deps).
+"""
+from __future__ import absolute_import
+import inspect
+import traceback
+import os
+import threading
+import hashlib
+import cPickle as pickle
+import idiotest.exception
+
+TestException = idiotest.exception.TestException
+TestFailure = idiotest.exception.TestFailure
+
+SCOPES = ('module', 'session')
+
+# The name of files which define session fixtures
+FIXTURE_FILE = 'conftest.py'
+
+# Changes when the format of cached fixture values changes
+CACHE_FORMAT = 2
+
+_local = threading.local()
+
+def current():
+    """Get the scope and fixture being evaluated or torn down.
+
+    Returns (None, None) outside fixture code.
+    """
+    return getattr(_local, 'current', (None, None))
+
+def set_current(scope, fixture):
+    prev = current()
+    _local.current = scope, fixture
+    return prev
+
+class FixtureError(TestFailure):
+    def __init__(self, name, reason):
+        TestFailure.__init__(self, u'fixture %r failed' % (name,))
+        self.write(reason)
+
+def argnames(obj):
+    """Get the names of the parameters which a callable requires."""
+    if inspect.isclass(obj):
+        return []
+    if inspect.isfunction(obj):
+        func, skip = obj, 0
+    elif inspect.ismethod(obj):
+        func, skip = obj.im_func, 1
+    else:
+        call = getattr(obj, '__call__', None)
+        if not inspect.ismethod(call):
+            return []
+        func, skip = call.im_func, 1
+    args, varargs, varkw, defaults = inspect.getargspec(func)
+    args = args[skip:]
+    if defaults:
+        args = args[:-len(defaults)]
+    return [arg for arg in args if isinstance(arg, str)]
+
+def file_digest(path, hash):
+    fp = open(path, 'rb')
+    try:
+        while True:
+            data = fp.read(65536)
+            if not data:
+                break
+            hash.update(data)
+    finally:
+        fp.close()
+
+class Fixture(object):
+    """A fixture registered by a test module."""
+
+    def __init__(self, name, func, path, scope='module',
+                 inputs=(), cache=False):
+        if scope not in SCOPES:
+            raise ValueError('invalid fixture scope: %r' % (scope,))
+        if cache and inspect.isgeneratorfunction(func):
+            raise ValueError('fixture %r: cannot cache a generator' %
+                             (name,))
+        self.name = name
+        self.func = func
+        self.path = path
+        self.scope = scope
+        self.params = argnames(func)
+        self.inputs = [os.path.join(os.path.dirname(path), x)
+                       for x in inputs]
+        self.cache = cache
+
+    def cache_key(self, deps=()):
+        """Get the key for caching the fixture value on disk.
+
+        The 'deps' are the keys of the fixtures this one uses.
+        """
+        hash = hashlib.sha1()
+        hash.update(repr((CACHE_FORMAT, self.name, self.path, self.scope)))
+        for key in deps:
+            hash.update('\0%s' % key)
+        code = getattr(self.func, 'func_code', None)
+        if code is not None:
+            hash.update(code.co_code)
+            hash.update(repr(code.co_consts))
+        for path in self.inputs:
+            hash.update('\0%s\0' % path)
+            file_digest(path, hash)
+        return hash.hexdigest()
+
+class Scope(object):
+    """Fixture definitions and values for a module or session."""
+
+    def __init__(self, name, cache_dir=None):
+        self.name = name
+        self.cache_dir = cache_dir
+        self.fixtures = {}
+        self.values = {}
+        # Files used by each fixture, by name (see idiotest.deps)
+        self.usage = {}
+        self.teardowns = []
+        self.cleanups = []
+        # Scratch directories, by fixture directory (see idiotest.scratch)
+        self.scratch_dirs = {}
+
+    def add_cleanup(self, func):
+        """Call a function when the scope closes, after the teardowns."""
+        self.cleanups.append(func)
+
+    def register(self, fixture):
+        old = self.fixtures.get(fixture.name)
+        if old is not None and (self.name == 'module' or
+                                old.path != fixture.path):
+            raise Exception('Duplicate fixture name: %r' % (fixture.name,))
+        self.fixtures[fixture.name] = fixture
+
+    def evaluate(self, fixture, key, resolve):
+        """Evaluate a fixture, using the on-disk cache if enabled.
+
+        The 'key' is the cache key, and 'resolve' is a function which
+        returns the fixture's arguments.  It is only called if the
+        value is not cached.  The files the fixture used are cached
+        with the value.
+        """
+        if not fixture.cache or self.cache_dir is None:
+            return self.setup(fixture, resolve())
+        path = os.path.join(self.cache_dir, '%s.pickle' % (key,))
+        try:
+            fp = open(path, 'rb')
+        except IOError:
+            pass
+        else:
+            try:
+                value, files = pickle.load(fp)
+            finally:
+                fp.close()
+            self.usage[fixture.name] = set(files)
+            return value
+        value = self.setup(fixture, resolve())
+        files = sorted(self.usage.get(fixture.name, ()))
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        tmppath = '%s.%d.tmp' % (path, os.getpid())
+        fp = open(tmppath, 'wb')
+        try:
+            pickle.dump((value, files), fp, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fp.close()
+        os.rename(tmppath, path)
+        return value
+
+    def setup(self, fixture, kw):
+        if not inspect.isgeneratorfunction(fixture.func):
+            return fixture.func(**kw)
+        gen = fixture.func(**kw)
+        try:
+            value = gen.next()
+        except StopIteration:
+            raise Exception('fixture %r did not yield a value' %
+                            (fixture.name,))
+        self.teardowns.append((fixture, gen))
+        return value
+
+    def close(self):
+        """Tear down the fixtures in this scope.
+
+        Returns a description of any errors, or None.
+        """
+        errors = []
+        teardowns = self.teardowns
+        self.teardowns = []
+        self.values = {}
+        while teardowns:
+            fixture, gen = teardowns.pop()
+            prev = set_current(self, fixture)
+            try:
+                gen.next()
+            except StopIteration:
+                pass
+            except KeyboardInterrupt:
+                raise
+            except:
+                errors.append(u'fixture %r teardown failed\n%s' %
+                              (fixture.name, traceback.format_exc()))
+            else:
+                errors.append(u'fixture %r yielded more than once' %
+                              (fixture.name,))
+            finally:
+                set_current(*prev)
+        cleanups = self.cleanups
+        self.cleanups = []
+        while cleanups:
+            func = cleanups.pop()
+            try:
+                func()
+            except KeyboardInterrupt:
+                raise
+            except:
+                errors.append(u'fixture cleanup failed\n%s' %
+                              (traceback.format_exc(),))
+        if errors:
+            return u'\n'.join(errors)
+        return None
+
+class Fixtures(object):
+    """The fixtures visible to a single module."""
+
+    def __init__(self, path, session=None, scope='module'):
+        self.path = path
+        self.scope = scope
+        if session is None:
+            session = Scope('session')
+        self.session = session
+        self.module = Scope('module', session.cache_dir)
+        self.active = set()
+
+    def fixture(self, *arg, **kw):
+        """Register a fixture.
+
+        Can be called directly or used as a decorator.  Examples:
+
+            fixture(name, func, **kw)
+            @fixture
+            @fixture(**kw)
+            @fixture(name, **kw)
+
+        Keyword arguments are 'scope', which is 'module' (default) or
+        'session', 'inputs', a list of files the fixture reads, and
+        'cache', which saves the value on disk if True.
+        """
+        kw.setdefault('scope', self.scope)
+        if self.scope == 'session' and kw['scope'] != 'session':
+            raise ValueError('fixture files can only define session '
+                             'fixtures')
+        def register(name, func):
+            fixture = Fixture(name, func, self.path, **kw)
+            if fixture.scope == 'session':
+                self.session.register(fixture)
+            else:
+                self.module.register(fixture)
+            return func
+        if not arg:
+            def deco0(func):
+                return register(func.__name__, func)
+            return deco0
+        elif len(arg) == 1:
+            param = arg[0]
+            if isinstance(param, basestring):
+                def deco1(func):
+                    return register(param, func)
+                return deco1
+            elif callable(param):
+                return register(param.__name__, param)
+            else:
+                raise TypeError(
+                    "'fixture' requires either a name or callable")
+        elif len(arg) == 2:
+            return register(*arg)
+        else:
+            raise ValueError(
+                "'fixture' expects two or fewer positional arguments")
+
+    def lookup(self, name, session_only=False):
+        if not session_only:
+            try:
+                return self.module, self.module.fixtures[name]
+            except KeyError:
+                pass
+        try:
+            return self.session, self.session.fixtures[name]
+        except KeyError:
+            if session_only and name in self.module.fixtures:
+                raise Exception(
+                    'session fixture cannot use module fixture %r' %
+                    (name,))
+            raise Exception(
+                'no such fixture: %r (session fixtures used by other '
+                'modules belong in %s)' % (name, FIXTURE_FILE))
+
+    def get(self, name, session_only=False):
+        """Get the value of a fixture, evaluating it if necessary."""
+        scope, fixture = self.lookup(name, session_only)
+        try:
+            ok, value = scope.values[name]
+        except KeyError:
+            pass
+        else:
+            if ok:
+                return value
+            raise value
+        if name in self.active:
+            raise Exception('fixture %r depends on itself' % (name,))
+        self.active.add(name)
+        prev = set_current(scope, fixture)
+        try:
+            try:
+                if fixture.scope == 'session':
+                    value = self.evaluate_session(scope, fixture)
+                else:
+                    value = self.evaluate(scope, fixture, False)
+            except KeyboardInterrupt:
+                raise
+            except TestException, ex:
+                scope.values[name] = False, ex
+                raise
+            except:
+                ex = FixtureError(name, traceback.format_exc())
+                scope.values[name] = False, ex
+                raise ex
+        finally:
+            set_current(*prev)
+            self.active.discard(name)
+        scope.values[name] = True, value
+        return value
+
+    def evaluate_session(self, scope, fixture):
+        """Evaluate a session fixture in the directory which defines it."""
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(fixture.path))
+        try:
+            return self.evaluate(scope, fixture, True)
+        finally:
+            os.chdir(cwd)
+
+    def evaluate(self, scope, fixture, session_only):
+        if fixture.cache and scope.cache_dir is not None:
+            key = self.cache_key(fixture, session_only, set())
+        else:
+            key = None
+        def resolve():
+            return self.resolve(fixture.params, session_only)
+        return scope.evaluate(fixture, key, resolve)
+
+    def cache_key(self, fixture, session_only, active):
+        """Get a fixture's cache key, without evaluating any fixtures."""
+        if fixture.name in active:
+            raise Exception('fixture %r depends on itself' % (fixture.name,))
+        active.add(fixture.name)
+        deps = []
+        for name in fixture.params:
+            dep = self.lookup(name, session_only)[1]
+            deps.append(self.cache_key(
+                dep, session_only or dep.scope == 'session', active))
+        active.discard(fixture.name)
+        return fixture.cache_key(deps)
+
+    def resolve(self, names, session_only=False):
+        """Get the values of a list of fixtures, as a dictionary."""
+        kw = {}
+        for name in names:
+            kw[name] = self.get(name, session_only)
+        return kw
+
+    def files(self, names, session_only=False, seen=None):
+        """Get the files used by fixtures and the fixtures they use.
+
+        This includes each fixture's 'inputs' and the files used by
+        the programs it ran.  Fixtures which do not exist are ignored.
+        """
+        if seen is None:
+            seen = set()
+        paths = set()
+        for name in names:
+            if not session_only and name in self.module.fixtures:
+                scope = self.module
+            elif name in self.session.fixtures:
+                scope = self.session
+            else:
+                continue
+            if (scope.name, name) in seen:
+                continue
+            seen.add((scope.name, name))
+            fixture = scope.fixtures[name]
+            paths.update(os.path.realpath(path) for path in fixture.inputs)
+            paths.update(scope.usage.get(name, ()))
+            paths.update(self.files(
+                fixture.params, session_only or fixture.scope == 'session',
+                seen))
+        return paths
+
+    def close(self):
+        """Tear down the module fixtures.
+
+        Returns a description of any errors, or None.
+        """
+        return self.module.close()
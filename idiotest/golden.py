@@ -0,0 +1,94 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest golden file directories.
+
+A golden directory contains pairs of input and reference output
+files.  Each pair becomes one test, which runs a program with the
+input file on stdin and compares its output to the reference file.
+The directory is listed when the tests are run, not when they are
+registered, and the files for each case are only opened when that
+case runs.  Either file can be compressed with gzip, bzip2, or xz, in
+which case its name has an extra '.gz', '.bz2', or '.xz' suffix.
+"""
+from __future__ import absolute_import
+import os
+import idiotest.stream
+
+def split_pattern(pattern):
+    """Split a file name pattern containing one '*' into two parts."""
+    if pattern.count('*') != 1:
+        raise ValueError('pattern must contain one \'*\': %r' % (pattern,))
+    return tuple(pattern.split('*'))
+
+class GoldenCase(object):
+    """The callable object for a single case in a golden directory."""
+    __slots__ = ['group', 'case']
+
+    def __init__(self, group, case):
+        self.group = group
+        self.case = case
+
+    def __call__(self):
+        self.group.run_case(self.case)
+
+    def __repr__(self):
+        return '<GoldenCase %r>' % (self.case,)
+
+class GoldenDir(object):
+    """A directory of golden input and output files.
+
+    Iterating over a golden directory yields a test for each input
+    file which matches the pattern.  The 'mktest' parameter is a
+    function which creates a test from a name and callable object.
+    """
+
+    def __init__(self, mktest, proc, path, args, name,
+                 pattern='*.in', output='*.out', fail=False, **kw):
+        self.mktest = mktest
+        self.proc = proc
+        self.path = path
+        self.args = args
+        self.name = name
+        self.inpat = split_pattern(pattern)
+        self.outpat = split_pattern(output)
+        self.fail = fail
+        self.kw = kw
+
+    def cases(self):
+        """Get a sorted list of the case names."""
+        prefix, suffix = self.inpat
+        cases = set()
+        for fname in os.listdir(self.path):
+            fname = idiotest.stream.strip_suffix(fname)
+            if (fname.startswith(prefix) and fname.endswith(suffix)
+                and len(fname) > len(prefix) + len(suffix)):
+                cases.add(fname[len(prefix):len(fname)-len(suffix)])
+        return sorted(cases)
+
+    def __iter__(self):
+        for case in self.cases():
+            yield self.mktest('%s.%s' % (self.name, case),
+                              GoldenCase(self, case), fail=self.fail)
+
+    def case_path(self, pattern, case):
+        path = os.path.join(self.path, pattern[0] + case + pattern[1])
+        return idiotest.stream.find(path)
+
+    def case_args(self, case):
+        """Get the program arguments for a case."""
+        if callable(self.args):
+            return self.args(case)
+        return self.args
+
+    def run_case(self, case):
+        """Run a single case."""
+        infile = idiotest.stream.open(self.case_path(self.inpat, case))
+        try:
+            outfile = idiotest.stream.open(self.case_path(self.outpat, case))
+            try:
+                self.proc.check_output(self.case_args(case), input=infile,
+                                       output=outfile, **self.kw)
+            finally:
+                outfile.close()
+        finally:
+            infile.close()
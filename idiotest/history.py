@@ -0,0 +1,199 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest run history.
+
+The history is a SQLite database which records the outcome, wall
+time, and child CPU time of each test in each run.  The history
+report uses it to find tests which are getting slower and tests which
+are flaky.
+
+A test's duration has drifted if the mean of its most recent runs is
+too far above the mean of the runs before them, measured in standard
+errors.  A test is flaky if its outcome changed back and forth more
+than once in its recent runs.
+"""
+from __future__ import absolute_import
+import math
+import time
+import resource
+import idiotest.suite
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs (id),
+    test TEXT NOT NULL,
+    status TEXT NOT NULL,
+    ok INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    cpu REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_test ON results (test, run);
+'''
+
+def connect(path):
+    """Open a history database, creating it if necessary."""
+    if sqlite3 is None:
+        raise Exception('the history requires the sqlite3 module')
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    return db
+
+def child_cpu():
+    """Get the CPU time used by finished child processes."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class History(idiotest.suite.Callback):
+    """Callback object which records results in a history database.
+
+    Results are committed after each module.  Tests which ran on a
+    distributed worker carry their child CPU time in a 'cpu'
+    attribute.
+    """
+
+    def __init__(self, path):
+        self.db = connect(path)
+        cursor = self.db.execute('INSERT INTO runs (time) VALUES (?)',
+                                 (time.time(),))
+        self.run = cursor.lastrowid
+        self.db.commit()
+        self.cpu = None
+
+    def module_end(self, module):
+        self.db.commit()
+    def module_pass(self, module):
+        self.module_end(module)
+    def module_skip(self, module, reason):
+        self.module_end(module)
+    def module_fail(self, module, reason):
+        self.module_end(module)
+
+    def test_begin(self, test):
+        self.cpu = child_cpu()
+        return True
+
+    def test_end(self, test, status, ok):
+        if test.timing.start is None:
+            return
+        name = test.fullname
+        if not isinstance(name, unicode):
+            name = name.decode('UTF-8', 'replace')
+        cpu = getattr(test, 'cpu', None)
+        if cpu is None:
+            cpu = child_cpu() - self.cpu
+        self.db.execute(
+            'INSERT INTO results (run, test, status, ok, duration, cpu) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self.run, name, status, ok, test.timing.total, cpu))
+    def test_pass(self, test):
+        self.test_end(test, 'pass', not test.fail)
+    def test_skip(self, test, reason):
+        self.test_end(test, 'skip', False)
+    def test_fail(self, test, reason):
+        self.test_end(test, 'fail', bool(test.fail))
+
+    def print_summary(self):
+        pass
+
+    def close(self):
+        if self.db is None:
+            return
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+def mean_stddev(values):
+    n = len(values)
+    mean = sum(values) / n
+    if n < 2:
+        return mean, 0.0
+    var = sum([(x - mean) ** 2 for x in values]) / (n - 1)
+    return mean, math.sqrt(var)
+
+def drift(durations, recent=5, threshold=3.0, min_samples=5):
+    """Test whether durations have drifted upwards.
+
+    The durations are listed from newest to oldest.  The mean of the
+    'recent' newest durations is compared with the mean of the rest.
+    Returns (old mean, new mean, z score) if the z score exceeds the
+    threshold, or None otherwise.
+    """
+    new = durations[:recent]
+    old = durations[recent:]
+    if len(new) < recent or len(old) < min_samples:
+        return None
+    old_mean, old_stddev = mean_stddev(old)
+    new_mean = sum(new) / len(new)
+    # Timer resolution and scheduling make tiny deviations meaningless
+    error = max(old_stddev, old_mean * 0.01, 1e-3) / math.sqrt(len(new))
+    z = (new_mean - old_mean) / error
+    if z <= threshold:
+        return None
+    return old_mean, new_mean, z
+
+def changes(outcomes):
+    """Count how many times a list of outcomes changes value."""
+    return len([1 for a, b in zip(outcomes, outcomes[1:]) if a != b])
+
+def analyze(db, window=20, recent=5, threshold=3.0):
+    """Find tests whose durations drifted and tests which are flaky.
+
+    Returns (drifted, flaky).  Each drifted test is (name, old mean,
+    new mean, z score), and each flaky test is (name, runs, failures,
+    changes).  Only passing runs count towards durations, and only the
+    'window' most recent runs before the 'recent' runs are used for
+    the baseline.
+    """
+    drifted = []
+    flaky = []
+    tests = [row[0] for row in
+             db.execute('SELECT DISTINCT test FROM results ORDER BY test')]
+    for test in tests:
+        rows = db.execute(
+            'SELECT status, ok, duration FROM results '
+            'WHERE test = ? AND status != ? ORDER BY run DESC LIMIT ?',
+            (test, 'skip', window + recent)).fetchall()
+        durations = [duration for status, ok, duration in rows if ok]
+        result = drift(durations, recent, threshold)
+        if result is not None:
+            drifted.append((test,) + result)
+        outcomes = [ok for status, ok, duration in rows[:window]]
+        nchanges = changes(outcomes)
+        if nchanges > 1:
+            flaky.append((test, len(outcomes),
+                          len([ok for ok in outcomes if not ok]), nchanges))
+    return drifted, flaky
+
+def print_report(path, window=20, recent=5, threshold=3.0):
+    """Print the tests whose durations drifted and the flaky tests."""
+    db = connect(path)
+    try:
+        nruns, = db.execute('SELECT COUNT(*) FROM runs').fetchone()
+        drifted, flaky = analyze(db, window, recent, threshold)
+    finally:
+        db.close()
+    print 'runs recorded: %d' % (nruns,)
+    print
+    if drifted:
+        print 'slower tests:'
+        for test, old, new, z in drifted:
+            print '  %8.3fs -> %8.3fs  (+%.0f%%, z=%.1f)  %s' % (
+                old, new, (new - old) * 100.0 / old if old else 0.0, z,
+                test.encode('UTF-8'))
+        print
+    if flaky:
+        print 'flaky tests:'
+        for test, nruns, nfail, nchanges in flaky:
+            print '  %d of %d runs failed, %d changes  %s' % (
+                nfail, nruns, nchanges, test.encode('UTF-8'))
+        print
+    if not drifted and not flaky:
+        print 'no slower or flaky tests'
@@ -0,0 +1,202 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest result journal.
+
+The journal is a file which records the outcome of each test as soon
+as it finishes, one JSON object per line.  If the test run is
+interrupted or killed, the journal still has the results of every
+test which finished, and a later run can resume from it, skipping the
+tests which already passed.
+
+The first line of the journal records a fingerprint of the test
+suite, computed from the names and contents of the test modules.  A
+journal is only used to resume a run of the same suite.
+"""
+from __future__ import absolute_import
+import hashlib
+import json
+import os
+import sys
+import time
+import idiotest.suite
+import idiotest.timing
+
+def fingerprint(suite):
+    """Compute the fingerprint of a scanned test suite."""
+    h = hashlib.sha1()
+    files = [(module.name, module.path) for module in suite.modules]
+    root = os.path.abspath(suite.root)
+    files.extend([(os.path.relpath(path, root), path)
+                  for path in suite.fixture_files])
+    for name, path in files:
+        h.update(name + '\0')
+        fp = open(path, 'rb')
+        try:
+            h.update(fp.read())
+        finally:
+            fp.close()
+        h.update('\0')
+    return h.hexdigest()
+
+def text(value):
+    if value is None or isinstance(value, unicode):
+        return value
+    return value.decode('UTF-8', 'replace')
+
+def read(path):
+    """Read a journal, returning (fingerprint, results).
+
+    The results map test names to True if the test passed, or False
+    otherwise.  Returns (None, {}) if the journal does not exist.  An
+    incomplete last line, left by an interrupted write, is ignored.
+    """
+    try:
+        fp = open(path, 'rb')
+    except IOError:
+        return None, {}
+    suite = None
+    results = {}
+    try:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'suite' in record:
+                suite = record['suite']
+            elif 'test' in record:
+                results[record['test']] = record['ok']
+    finally:
+        fp.close()
+    return suite, results
+
+class Journal(idiotest.suite.Callback):
+    """Callback object which records results in a journal file.
+
+    Each record is flushed as soon as it is written, so the results
+    survive if the harness is killed.  The file is synced to disk at
+    most once every 'sync' seconds, so the results also survive a
+    system crash without the cost of syncing after every test.
+
+    If 'resume' is True and the journal is for the same suite, new
+    results are appended to it, and 'passed' is the set of tests
+    which already passed.  Otherwise, the journal is started over.
+    """
+
+    def __init__(self, path, fingerprint, resume=False, sync=1.0):
+        self.path = path
+        self.sync = sync
+        self.passed = set()
+        self.nresumed = 0
+        start = True
+        if resume:
+            suite, results = read(path)
+            if suite == fingerprint:
+                start = False
+                self.passed = set(name for name, ok in results.iteritems()
+                                  if ok)
+            elif suite is not None:
+                sys.stderr.write('journal %s is for a different test suite, '
+                                 'running all tests\n' % (path,))
+        if start:
+            self.file = open(path, 'wb')
+        else:
+            self.file = open(path, 'ab')
+            if self.file.tell():
+                # Terminate a line left incomplete by an interrupted run
+                self.file.write('\n')
+        self.last_sync = idiotest.timing.clock()
+        if start:
+            self.write({'suite': fingerprint, 'time': time.time()})
+
+    def write(self, record):
+        self.file.write(json.dumps(record, sort_keys=True) + '\n')
+        self.file.flush()
+        now = idiotest.timing.clock()
+        if now - self.last_sync >= self.sync:
+            os.fsync(self.file.fileno())
+            self.last_sync = now
+
+    def module_end(self, module, status, reason):
+        if module.timing.start is None:
+            return
+        self.write({'module': module.name, 'status': status,
+                    'reason': text(reason), 'time': module.timing.total})
+    def module_pass(self, module):
+        self.module_end(module, 'pass', None)
+    def module_skip(self, module, reason):
+        self.module_end(module, 'skip', reason)
+    def module_fail(self, module, reason):
+        self.module_end(module, 'fail', reason)
+
+    def test_end(self, test, status, ok, reason):
+        if test.timing.start is None:
+            # The test did not run, either because it was not
+            # selected or because it passed in an earlier run
+            if ok and test.fullname in self.passed:
+                self.nresumed += 1
+            return
+        self.write({'test': test.fullname, 'status': status, 'ok': ok,
+                    'reason': text(reason), 'time': test.timing.total})
+    def test_pass(self, test):
+        self.test_end(test, 'pass', not test.fail, None)
+    def test_skip(self, test, reason):
+        self.test_end(test, 'skip', False, reason)
+    def test_fail(self, test, reason):
+        self.test_end(test, 'fail', bool(test.fail), reason)
+
+    def print_summary(self):
+        if self.nresumed:
+            print 'tests passed in earlier runs: %d' % (self.nresumed,)
+
+    def close(self):
+        """Sync the journal to disk and close it."""
+        if self.file is None:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+class Resume(object):
+    """Callback object which skips tests that passed in an earlier run.
+
+    Tests named in 'passed' are not run, but are reported to 'obj' as
+    passing, so the results of the earlier run are counted in the
+    summary.  All other results are passed to 'obj' unchanged.
+    """
+
+    def __init__(self, obj, passed):
+        self.obj = obj
+        self.passed = passed
+        self.resumed = None
+
+    def module_begin(self, module):
+        return self.obj.module_begin(module)
+    def module_pass(self, module):
+        self.obj.module_pass(module)
+    def module_skip(self, module, reason):
+        self.obj.module_skip(module, reason)
+    def module_fail(self, module, reason):
+        self.obj.module_fail(module, reason)
+
+    def test_begin(self, test):
+        if not self.obj.test_begin(test):
+            return False
+        if test.fullname in self.passed:
+            self.resumed = test
+            return False
+        return True
+    def test_pass(self, test):
+        self.obj.test_pass(test)
+    def test_skip(self, test, reason):
+        if test is not self.resumed:
+            self.obj.test_skip(test, reason)
+            return
+        self.resumed = None
+        if test.fail:
+            self.obj.test_fail(test, None)
+        else:
+            self.obj.test_pass(test)
+    def test_fail(self, test, reason):
+        self.obj.test_fail(test, reason)
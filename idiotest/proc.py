@@ -8,11 +8,29 @@ its output to the expected output.  It is fairly versatile.
 from __future__ import absolute_import
 import subprocess
 import idiotest.exception
+import idiotest.fixture
+import idiotest.timing
+import idiotest.trace
+import idiotest.scratch
+import idiotest.suite
+import idiotest.bindiff
+import idiotest.stream
 import difflib
 import errno
 import os.path
+import select
+import sys
+import hashlib
+import threading
+import tempfile
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
 
 TestFailure = idiotest.exception.TestFailure
+PIPE_BUF = getattr(select, 'PIPE_BUF', 512)
+clock = idiotest.timing.clock
 
 def getsigdict():
     import signal
@@ -51,6 +69,20 @@ class ProcOutputError(ProcFailure):
 class ProcBrokenPipe(ProcFailure):
     def __init__(self):
         ProcFailure.__init__(self, u"process closed stdin unexpectedly")
+class ProcSessionCrash(ProcFailure):
+    def __init__(self, retval):
+        if retval is None:
+            msg = u"session process stopped responding"
+        elif retval < 0:
+            msg = u"session process received %s" % signame(-retval)
+        else:
+            msg = u"session process exited (%i)" % retval
+        ProcFailure.__init__(self, msg)
+        self.retval = retval
+
+class ReplyTimeout(Exception):
+    """Raised inside a session when the reply does not arrive in time."""
+    pass
 
 def write_stream(name, stream, file):
     if not stream:
@@ -64,6 +96,9 @@ def write_stream(name, stream, file):
         except UnicodeDecodeError:
             pass
     if ustream is None:
+        if len(stream) > idiotest.bindiff.LIMIT:
+            idiotest.bindiff.dump(stream, file)
+            return
         file.write(u'<binary>\n')
         for line in stream.splitlines():
             file.write(u'  %s\n' % repr(line)[1:-1])
@@ -92,11 +127,21 @@ class Proc(object):
         self.cwd = cwd
         self.geterror = geterror
         self.broken_pipe = False
+        self.compare = None
+        self.spawn_time = 0.0
+        self.child_time = 0.0
 
-    def run(self):
-        """Run the process."""
+    def run(self, expect=None):
+        """Run the process.
+
+        If 'expect' is a file object, the output is compared with it
+        while the program runs, and only a prefix of the output is
+        kept.  Call 'check_output' with the same file object to check
+        the result.
+        """
         stderr = subprocess.PIPE if self.geterror else None
         stdin = self.input
+        feed = None
         if isinstance(stdin, basestring):
             if isinstance(stdin, unicode):
                 carg = stdin.encode('UTF-8')
@@ -105,19 +150,30 @@ class Proc(object):
             else:
                 raise TypeError('input should be string, file, or None')
             stdin = subprocess.PIPE
+        elif isinstance(stdin, file):
+            carg = None
         elif hasattr(stdin, 'read'):
+            # Compressed files and other file-like objects are copied
+            # to the program's input as they are read
+            feed = stdin
+            stdin = subprocess.PIPE
             carg = None
         elif stdin is None:
             stdin = subprocess.PIPE
             carg = None
         else:
             raise TypeError('input must be file, string, or None')
+        start = clock()
         proc = subprocess.Popen(
             self.args, executable=self.executable, cwd=self.cwd,
             stdin=stdin, stdout=subprocess.PIPE, stderr=stderr,
             close_fds=True)
+        spawned = clock()
         try:
-            output, error = proc.communicate(carg)
+            if feed is None and expect is None:
+                output, error = proc.communicate(carg)
+            else:
+                output, error = self.communicate(proc, feed or carg, expect)
         except OSError, ex:
             if ex.errno == errno.EPIPE:
                 self.broken_pipe = True
@@ -126,11 +182,103 @@ class Proc(object):
                 error = ''
             else:
                 raise
+        finally:
+            end = clock()
+            self.spawn_time = spawned - start
+            self.child_time = end - spawned
+            timing = idiotest.timing.current()
+            if timing is not None:
+                timing.spawn += self.spawn_time
+                timing.child += self.child_time
+                timing.nproc += 1
         retcode = proc.returncode
+        if idiotest.trace.tracer is not None:
+            text = idiotest.trace.text
+            idiotest.trace.span(
+                'proc', text(os.path.basename(self.args[0])), start, end,
+                {'args': [text(arg) for arg in self.args],
+                 'cwd': text(self.cwd), 'status': retcode,
+                 'spawn_us': int(self.spawn_time * 1e6)})
         self.output = output
         self.error = error
         self.retcode = retcode
 
+    def communicate(self, proc, input, expect):
+        """Exchange data with the program, streaming input and output.
+
+        The input is a string, a file object, or None.  If 'expect' is
+        not None, the output is compared with it as it arrives.
+        Returns the output, or its prefix, and the error output.
+        """
+        threads = []
+        errors = []
+        failures = []
+        if proc.stdin is not None:
+            threads.append(threading.Thread(
+                target=self.write_input, args=(proc.stdin, input, failures)))
+        if proc.stderr is not None:
+            def read_error():
+                errors.append(proc.stderr.read())
+            threads.append(threading.Thread(target=read_error))
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        if expect is not None:
+            compare = idiotest.stream.StreamCompare(expect)
+            self.compare = compare
+        chunks = []
+        fd = proc.stdout.fileno()
+        while True:
+            data = os.read(fd, idiotest.stream.CHUNK)
+            if not data:
+                break
+            if expect is not None:
+                compare.feed(data)
+            else:
+                chunks.append(data)
+        proc.stdout.close()
+        for thread in threads:
+            thread.join()
+        proc.wait()
+        if failures:
+            exc_type, exc_value, exc_tb = failures[0]
+            raise exc_type, exc_value, exc_tb
+        if expect is not None:
+            compare.finish()
+            output = compare.output()
+        else:
+            output = ''.join(chunks)
+        if errors:
+            error = errors[0]
+        else:
+            error = None
+        return output, error
+
+    def write_input(self, pipe, input, failures):
+        """Write the input to the program, then close its input."""
+        try:
+            try:
+                if isinstance(input, str):
+                    pipe.write(input)
+                elif input is not None:
+                    while True:
+                        data = idiotest.stream.read_chunk(input)
+                        if not data:
+                            break
+                        pipe.write(data)
+            finally:
+                try:
+                    pipe.close()
+                except EnvironmentError:
+                    pass
+        except EnvironmentError, ex:
+            if ex.errno == errno.EPIPE:
+                self.broken_pipe = True
+            else:
+                failures.append(sys.exc_info())
+        except:
+            failures.append(sys.exc_info())
+
     def check_exit(self, status):
         """Raise an exception if the process exited incorrectly.
 
@@ -168,7 +316,8 @@ class Proc(object):
         if isinstance(stdin, basestring):
             write_stream(u'stdin', stdin, err)
         elif hasattr(stdin, 'read'):
-            err.write(u"input file: %s\n" % repr(stdin.name))
+            err.write(u"input file: %s\n" %
+                      repr(getattr(stdin, 'name', '<stream>')))
         elif stdin is None:
             pass
         else:
@@ -184,47 +333,402 @@ class Proc(object):
         the output is decoded as UTF-8 and compared to the string.  If
         a file, the file contents are compared against the output.
         """
+        start = clock()
+        try:
+            self._check_output(output)
+        finally:
+            timing = idiotest.timing.current()
+            if timing is not None:
+                timing.compare += clock() - start
+
+    def _check_output(self, output):
         try:
             procout = self.output
         except AttributeError:
             raise Exception('program has not been run')
-        if isinstance(output, basestring):
-            outstr = output
-        elif hasattr(output, 'read'):
-            outstr = output.read()
-        elif output is None:
-            outstr = ''
-        else:
-            raise TypeError('output must be file, string, or None')
-        if isinstance(outstr, unicode):
-            try:
-                procout = procout.decode('UTF-8')
-            except UnicodeDecodeError:
-                err = ProcOutputError()
-                p.decorate(err)
-                write_stream(u'output', procout, err)
-                raise err
-            if procout != outstr:
-                err = ProcOutputError()
-                p.decorate(err)
-                eout = outstr.splitlines(True)
-                pout = procout.splitlines(True)
-                err.write(u"=== diff ===\n")
-                for line in difflib.Differ().compare(eout, pout):
-                    err.write(line)
-                raise err
-        elif isinstance(outstr, str):
-            if procout != outstr:
-                err = ProcOutputError()
-                self.decorate(err)
-                eout = [repr(x)+'\n' for x in outstr.splitlines(True)]
-                pout = [repr(x)+'\n' for x in procout.splitlines(True)]
-                err.write(u"=== diff ===\n")
-                for line in difflib.Differ().compare(eout, pout):
-                    err.write(line)
+        compare = self.compare
+        if compare is not None and output is compare.expected:
+            if compare.equal():
+                return
+            if compare.complete():
+                compare_output(procout, compare.expected_output(),
+                               self.decorate)
+            err = ProcOutputError()
+            self.decorate(err)
+            compare.write_report(err)
+            raise err
+        compare_output(procout, output, self.decorate)
+
+def compare_output(procout, output, decorate):
+    """Raise ProcOutputError if the program output is incorrect.
+
+    The expected output can be a file, string, unicode object, or
+    None, see Proc.check_output.  The 'decorate' function is called to
+    add information to the exception.
+    """
+    if isinstance(output, basestring):
+        outstr = output
+    elif hasattr(output, 'read'):
+        outstr = output.read()
+    elif output is None:
+        outstr = ''
+    else:
+        raise TypeError('output must be file, string, or None')
+    if isinstance(outstr, unicode):
+        try:
+            procout = procout.decode('UTF-8')
+        except UnicodeDecodeError:
+            err = ProcOutputError()
+            decorate(err)
+            write_stream(u'output', procout, err)
+            raise err
+        if procout != outstr:
+            err = ProcOutputError()
+            decorate(err)
+            eout = outstr.splitlines(True)
+            pout = procout.splitlines(True)
+            err.write(u"=== diff ===\n")
+            for line in difflib.Differ().compare(eout, pout):
+                err.write(line)
+            raise err
+    elif isinstance(outstr, str):
+        if procout != outstr:
+            err = ProcOutputError()
+            decorate(err)
+            if (len(outstr) + len(procout) > idiotest.bindiff.LIMIT and
+                not (idiotest.bindiff.is_text(outstr) and
+                     idiotest.bindiff.is_text(procout))):
+                idiotest.bindiff.write_diff(outstr, procout, err)
                 raise err
+            eout = [repr(x)+'\n' for x in outstr.splitlines(True)]
+            pout = [repr(x)+'\n' for x in procout.splitlines(True)]
+            err.write(u"=== diff ===\n")
+            for line in difflib.Differ().compare(eout, pout):
+                err.write(line)
+            raise err
+    else:
+        raise TypeError('output must yield a string or unicode object')
+
+class DelimiterProtocol(object):
+    """Session protocol where each message ends with a delimiter.
+
+    The delimiter is appended to requests and removed from replies.
+    """
+
+    def __init__(self, delimiter='\n'):
+        self.delimiter = delimiter
+
+    def write(self, session, data):
+        session.write(data + self.delimiter)
+
+    def read(self, session):
+        return session.read_until(self.delimiter)
+
+class LengthProtocol(object):
+    """Session protocol where each message has a length prefix.
+
+    Each message is preceded by its length in bytes, in decimal,
+    followed by a newline.
+    """
+
+    def write(self, session, data):
+        session.write('%d\n%s' % (len(data), data))
+
+    def read(self, session):
+        line = session.read_until('\n')
+        try:
+            size = int(line)
+        except ValueError:
+            raise ProcFailure(u'invalid length prefix: %r' % (line,))
+        return session.read_exact(size)
+
+PROTOCOLS = {
+    'line': lambda: DelimiterProtocol('\n'),
+    'null': lambda: DelimiterProtocol('\0'),
+    'length': LengthProtocol,
+}
+
+class Session(object):
+    """A Session keeps a process running and sends it many requests.
+
+    Each request is written to the process's stdin and the process
+    writes a reply to stdout.  The protocol determines how requests
+    and replies are framed.  If the process exits or closes its pipes,
+    the request fails and a new process is started for the next
+    request.  Requests from different threads are sent one at a time.
+    If the reply does not arrive within 'timeout' seconds, the process
+    is killed and the request fails.
+    """
+
+    def __init__(self, args, protocol, executable=None, cwd=None,
+                 geterror=False, timeout=60.0):
+        self.args = list(args)
+        self.protocol = protocol
+        self.executable = executable
+        self.cwd = cwd
+        self.geterror = geterror
+        self.timeout = timeout
+        self.deadline = None
+        self.proc = None
+        self.errfile = None
+        self.last_error = None
+        self.buf = ''
+        self.wbuf = ''
+        self.wpos = 0
+        self.nstart = 0
+        self.crashes = []
+        self.lock = threading.RLock()
+
+    def start(self):
+        """Start the process."""
+        if self.errfile is not None:
+            self.errfile.close()
+            self.errfile = None
+        self.last_error = None
+        if self.geterror:
+            self.errfile = tempfile.TemporaryFile()
+            stderr = self.errfile
         else:
-            raise TypeError('output must yield a string or unicode object')
+            stderr = None
+        start = clock()
+        self.proc = subprocess.Popen(
+            self.args, executable=self.executable, cwd=self.cwd,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+            close_fds=True)
+        timing = idiotest.timing.current()
+        if timing is not None:
+            timing.spawn += clock() - start
+            timing.nproc += 1
+        self.buf = ''
+        self.wbuf = ''
+        self.wpos = 0
+        self.nstart += 1
+
+    def stop(self):
+        """Stop the process and return its exit status.
+
+        The error output is kept for reporting a crash.
+        """
+        self.lock.acquire()
+        try:
+            return self._stop()
+        finally:
+            self.lock.release()
+
+    def _stop(self):
+        proc = self.proc
+        if proc is None:
+            return None
+        self.proc = None
+        try:
+            proc.stdin.close()
+        except IOError:
+            pass
+        proc.stdout.close()
+        retcode = proc.wait()
+        errfile = self.errfile
+        if errfile is not None:
+            self.errfile = None
+            errfile.seek(0)
+            self.last_error = errfile.read()
+            errfile.close()
+        return retcode
+
+    close = stop
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def write(self, data):
+        """Write data to the process (used by protocols).
+
+        The data is queued, and written while the reply is read, so
+        a process which replies as it reads does not block.
+        """
+        if self.wpos:
+            self.wbuf = self.wbuf[self.wpos:]
+            self.wpos = 0
+        self.wbuf += data
+
+    def fill(self):
+        rfd = self.proc.stdout.fileno()
+        wfd = self.proc.stdin.fileno()
+        while True:
+            if self.wpos < len(self.wbuf):
+                wlist = [wfd]
+            else:
+                wlist = []
+            if self.deadline is None:
+                timeout = None
+            else:
+                timeout = max(0.0, self.deadline - clock())
+            readable, writable, x = select.select([rfd], wlist, [], timeout)
+            if not readable and not writable:
+                raise ReplyTimeout()
+            if writable:
+                # Writing PIPE_BUF bytes to a writable pipe never blocks
+                pos = self.wpos
+                self.wpos += os.write(wfd, self.wbuf[pos:pos+PIPE_BUF])
+            if readable:
+                break
+        data = os.read(rfd, 65536)
+        if not data:
+            raise EOFError()
+        self.buf += data
+
+    def read_until(self, delimiter):
+        """Read data up to a delimiter (used by protocols)."""
+        pos = 0
+        while True:
+            idx = self.buf.find(delimiter, pos)
+            if idx >= 0:
+                data = self.buf[:idx]
+                self.buf = self.buf[idx+len(delimiter):]
+                return data
+            pos = max(0, len(self.buf) - len(delimiter) + 1)
+            self.fill()
+
+    def read_exact(self, size):
+        """Read exactly 'size' bytes (used by protocols)."""
+        while len(self.buf) < size:
+            self.fill()
+        data = self.buf[:size]
+        self.buf = self.buf[size:]
+        return data
+
+    def request(self, input):
+        """Send a request and return the reply.
+
+        If the process crashes, raise ProcSessionCrash.  The process
+        is restarted on the next request.
+        """
+        if isinstance(input, unicode):
+            input = input.encode('UTF-8')
+        self.lock.acquire()
+        try:
+            return self._request(input)
+        finally:
+            self.lock.release()
+
+    def _request(self, input):
+        if self.proc is None:
+            self.start()
+        start = clock()
+        if self.timeout is not None:
+            self.deadline = start + self.timeout
+        try:
+            try:
+                self.protocol.write(self, input)
+                return self.protocol.read(self)
+            except ReplyTimeout:
+                self.proc.kill()
+                self.stop()
+                self.crash(input, None)
+            except (EOFError, OSError, IOError), ex:
+                if (isinstance(ex, EnvironmentError)
+                    and ex.errno != errno.EPIPE):
+                    raise
+        finally:
+            self.deadline = None
+            timing = idiotest.timing.current()
+            if timing is not None:
+                timing.child += clock() - start
+        self.crash(input, self.stop())
+
+    def crash(self, input, retcode):
+        """Report a failed request, with the exit status or None."""
+        err = ProcSessionCrash(retcode)
+        self.crashes.append((input, retcode))
+        self.decorate(err, input)
+        raise err
+
+    def error_output(self):
+        errfile = self.errfile
+        if errfile is None:
+            data = self.last_error
+            self.last_error = None
+            return data
+        errfile.seek(0)
+        data = errfile.read()
+        errfile.seek(0)
+        errfile.truncate()
+        return data
+
+    def decorate(self, err, input):
+        """Add process and request information to an exception."""
+        err.write(u'command: %s\n' % ' '.join(self.args))
+        if self.cwd is not None:
+            err.write(u'cwd: %s\n' % self.cwd)
+        err.write(u'process starts: %d\n' % self.nstart)
+        write_stream(u'request', input, err)
+        write_stream(u'stderr', self.error_output(), err)
+
+    def check_output(self, input, output=None):
+        """Send a request and check the reply against a reference.
+
+        The reference output is treated the same way as in
+        Proc.check_output.
+        """
+        # Hold the lock so the error output belongs to this request
+        self.lock.acquire()
+        try:
+            reply = self.request(input)
+            start = clock()
+            try:
+                compare_output(reply, output,
+                               lambda err: self.decorate(err, input))
+            finally:
+                timing = idiotest.timing.current()
+                if timing is not None:
+                    timing.compare += clock() - start
+        finally:
+            self.lock.release()
+
+class OutputCache(object):
+    """A cache of program output, with LRU eviction by total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get the cached output for a key, or None."""
+        self.lock.acquire()
+        try:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries[key] = value
+            self.hits += 1
+            return value
+        finally:
+            self.lock.release()
+
+    def put(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        self.lock.acquire()
+        try:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = value
+            self.size += size
+            while self.size > self.max_bytes:
+                oldkey, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+        finally:
+            self.lock.release()
 
 class ProcRunner(object):
     """A ProcRunner runs programs for a test suite.
@@ -257,6 +761,87 @@ class ProcRunner(object):
             self.wrap = wrap
         else:
             self.wrap = None
+        if options.scratch:
+            self.scratch = idiotest.scratch.Scratch(options.scratch)
+        else:
+            self.scratch = None
+        if options.deps:
+            self.usage = {}
+        else:
+            self.usage = None
+        memo_size = options.memo_size
+        if memo_size and self.wrap is None and OrderedDict is not None:
+            self.memo = OutputCache(memo_size * 1024 * 1024)
+        else:
+            self.memo = None
+
+    def close(self):
+        """Release resources after the test suite runs."""
+        if self.scratch is not None:
+            self.scratch.close()
+            self.scratch = None
+
+    def default_cwd(self, cwd):
+        """Get the working directory for a program.
+
+        In scratch mode, programs run in the test's scratch directory
+        unless a working directory is given.
+        """
+        if cwd is None and self.scratch is not None:
+            return self.scratch.current()
+        return cwd
+
+    def usage_paths(self):
+        """Get the set of files used by the current fixture or test.
+
+        Files used by a fixture are recorded on the fixture's scope,
+        and counted for every test which uses the fixture.  Fixtures
+        always record their files, since the files are saved with
+        cached fixture values.  Returns None if there is nowhere to
+        record files.
+        """
+        scope, fixture = idiotest.fixture.current()
+        if fixture is not None:
+            return scope.usage.setdefault(fixture.name, set())
+        if self.usage is None:
+            return None
+        test = idiotest.suite.current_test()
+        if test is None:
+            return None
+        return self.usage.setdefault(test.fullname, set())
+
+    def record_usage(self, args, executable, kw):
+        """Record the files a program uses as dependencies of the test.
+
+        The program's executable, its input file, and any arguments
+        which name existing files are recorded.  See idiotest.deps.
+        """
+        paths = self.usage_paths()
+        if paths is None:
+            return
+        cwd = kw.get('cwd')
+        if cwd is None:
+            cwd = os.getcwd()
+        paths.add(os.path.realpath(os.path.join(cwd, executable)))
+        if self.wrap is not None:
+            paths.add(os.path.realpath(self.executable))
+        for arg in args[1:]:
+            if isinstance(arg, basestring):
+                path = os.path.join(cwd, arg)
+                if os.path.isfile(path):
+                    paths.add(os.path.realpath(path))
+        self.record_file(kw.get('input'), paths)
+
+    def record_file(self, obj, paths=None):
+        """Record a file object as a dependency of the test."""
+        if paths is None:
+            paths = self.usage_paths()
+            if paths is None:
+                return
+        name = getattr(obj, 'name', None)
+        if not isinstance(name, basestring) or not os.path.isfile(name):
+            return
+        paths.add(os.path.realpath(name))
 
     def find_executable(self, name):
         """Find an executable in the search path.
@@ -287,12 +872,41 @@ class ProcRunner(object):
         """
         if executable is None:
             executable = self.find_executable(args[0])
+        self.record_usage(args, executable, kw)
         if self.wrap is not None:
             args = self.wrap + [executable] + args[1:]
             executable = self.executable
         geterror = geterror or self.geterror
+        kw['cwd'] = self.default_cwd(kw.get('cwd'))
         return Proc(args, executable=executable, geterror=geterror, **kw)
 
+    def session(self, args, protocol='line', delimiter=None,
+                executable=None, geterror=False, **kw):
+        """Create a Session object for sending many requests to a program.
+
+        The protocol can be 'line' (messages end with a newline),
+        'null' (messages end with a NUL byte), 'length' (messages are
+        preceded by their length and a newline), or a protocol object.
+        If the delimiter is given, it is used to end messages instead.
+        """
+        if delimiter is not None:
+            protocol = DelimiterProtocol(delimiter)
+        elif isinstance(protocol, basestring):
+            try:
+                protocol = PROTOCOLS[protocol]()
+            except KeyError:
+                raise ValueError('unknown protocol: %r' % (protocol,))
+        if executable is None:
+            executable = self.find_executable(args[0])
+        self.record_usage(args, executable, kw)
+        if self.wrap is not None:
+            args = self.wrap + [executable] + args[1:]
+            executable = self.executable
+        geterror = geterror or self.geterror
+        kw['cwd'] = self.default_cwd(kw.get('cwd'))
+        return Session(args, protocol, executable=executable,
+                       geterror=geterror, **kw)
+
     def run(self, args, status=0, **kw):
         """Run a program and return the Proc object.
 
@@ -307,17 +921,87 @@ class ProcRunner(object):
         proc.check_exit(status)
         return proc
 
-    def get_output(self, args, **kw):
+    def get_output(self, args, memo=False, **kw):
         """Run a program and return its output.
 
-        Fails under the same conditions as 'run'.
+        Fails under the same conditions as 'run'.  If 'memo' is True,
+        the output may be remembered and reused by later calls with
+        the same executable, arguments, working directory, and input.
+        Only use this for programs whose output depends on nothing
+        else.  Memoization is disabled when commands are wrapped.
         """
+        if memo and self.memo is not None:
+            self.record_file(kw.get('input'))
+            key, kw = self.memo_key(args, kw)
+            if key is not None:
+                output = self.memo.get(key)
+                if output is not None:
+                    self.record_usage(args, key[0], {'cwd': key[3]})
+                else:
+                    output = self.run(args, **kw).output
+                    self.memo.put(key, output)
+                return output
         return self.run(args, **kw).output
 
+    def memo_key(self, args, kw):
+        """Get the memoization key for running a program.
+
+        Returns the key and the keyword arguments to use for running
+        the program.  File input is read, so the keyword arguments
+        may contain the file contents instead.  The key is None if the
+        output should not be memoized.
+        """
+        status = kw.get('status', 0)
+        if status is not None and not isinstance(status, int):
+            return None, kw
+        executable = kw.get('executable')
+        if executable is None:
+            executable = self.find_executable(args[0])
+        cwd = kw.get('cwd')
+        if cwd is None:
+            cwd = os.getcwd()
+        else:
+            cwd = os.path.abspath(cwd)
+        executable = os.path.join(cwd, executable)
+        try:
+            mtime = os.stat(executable).st_mtime
+        except OSError:
+            return None, kw
+        stdin = kw.get('input')
+        if hasattr(stdin, 'read'):
+            stdin = stdin.read()
+            kw = dict(kw)
+            kw['input'] = stdin
+        if isinstance(stdin, unicode):
+            stdin = stdin.encode('UTF-8')
+        if stdin is None:
+            digest = None
+        else:
+            digest = hashlib.sha1(stdin).hexdigest()
+        key = (executable, mtime, tuple(args), cwd, digest, status)
+        return key, kw
+
     def check_output(self, args, output=None, **kw):
         """Run a program and check its output against a reference.
 
         Fails under the same conditions as 'run'.  Raises an exception
         if the program output does not match the reference output.
         """
-        self.run(args, **kw).check_output(output)
+        self.record_file(output)
+        if not hasattr(output, 'read'):
+            self.run(args, **kw).check_output(output)
+            return
+        # Compare the output with the file as the program runs
+        status = kw.pop('status', 0)
+        proc = self.proc(args, **kw)
+        proc.run(expect=output)
+        proc.check_exit(status)
+        proc.check_output(output)
+
+    def open(self, path):
+        """Open an input or reference output file.
+
+        Files ending in '.gz', '.bz2', or '.xz' are decompressed as
+        they are read.
+        """
+        return idiotest.stream.open(path)
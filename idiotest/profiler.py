@@ -0,0 +1,111 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest harness profiler.
+
+The profiler is a callback object which runs cProfile while each
+module loads and runs.  The statistics for each module are saved in
+the output directory, along with the merged statistics for the whole
+suite.  Time spent waiting for child processes is reported separately,
+so the hotspots listed are the ones in the harness itself.
+"""
+from __future__ import absolute_import
+import cProfile
+import pstats
+import os
+import idiotest.suite
+
+# Built-in functions which block while a child process runs
+WAIT_FUNCS = ['select', 'poll', 'waitpid', 'posix.read', 'posix.fork']
+
+def is_wait(func):
+    """Test whether a profile function entry waits for a child."""
+    filename, lineno, name = func
+    if filename != '~':
+        return False
+    for wait in WAIT_FUNCS:
+        if wait in name:
+            return True
+    return False
+
+def funcname(func):
+    filename, lineno, name = func
+    if filename == '~':
+        return name
+    return '%s:%d(%s)' % (os.path.basename(filename), lineno, name)
+
+class Profiler(idiotest.suite.Callback):
+    """Callback object which profiles the harness.
+
+    The 'path' is the directory where statistics files are saved.
+    """
+
+    def __init__(self, path, count=20):
+        self.path = path
+        self.count = count
+        self.profile = None
+        self.files = []
+        self.modules = []
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def module_begin(self, module):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return True
+
+    def module_end(self, module):
+        profile = self.profile
+        if profile is None:
+            return
+        profile.disable()
+        self.profile = None
+        if module.timing.start is None:
+            return
+        path = os.path.join(self.path, module.name + '.pstats')
+        profile.dump_stats(path)
+        self.files.append(path)
+        self.modules.append(module)
+
+    def module_pass(self, module):
+        self.module_end(module)
+
+    def module_skip(self, module, reason):
+        self.module_end(module)
+
+    def module_fail(self, module, reason):
+        self.module_end(module)
+
+    def stats(self):
+        """Get the merged statistics, or None if nothing ran."""
+        if not self.files:
+            return None
+        stats = pstats.Stats(self.files[0])
+        for path in self.files[1:]:
+            stats.add(path)
+        return stats
+
+    def print_summary(self):
+        stats = self.stats()
+        if stats is None:
+            return
+        path = os.path.join(self.path, 'all.pstats')
+        stats.dump_stats(path)
+        child = 0.0
+        total = 0.0
+        for module in self.modules:
+            child += module.timing.spawn + module.timing.child
+            total += module.timing.total
+        entries = []
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            if not is_wait(func):
+                entries.append((tt, ct, nc, func))
+        entries.sort(reverse=True)
+        print 'profile saved to: %s' % (path,)
+        print 'module wall time: %.3fs' % (total,)
+        print 'child wall time: %.3fs' % (child,)
+        print 'harness wall time: %.3fs' % (total - child,)
+        print 'harness hotspots:'
+        print '  %9s %9s %9s  %s' % ('tottime', 'cumtime', 'ncalls', 'function')
+        for tt, ct, nc, func in entries[:self.count]:
+            print '  %9.3f %9.3f %9d  %s' % (tt, ct, nc, funcname(func))
+        print
@@ -6,17 +6,46 @@ import idiotest.suite
 import idiotest.env
 import idiotest.console
 import idiotest.sglob
+import idiotest.profiler
+import idiotest.trace
+import idiotest.collect
+import idiotest.scratch
+import idiotest.distrib
+import idiotest.journal
+import idiotest.daemon
+import idiotest.history
+import idiotest.deps
+import idiotest.stress
 import sys
-import os
 import optparse
 
-def run(root='.', exec_paths=()):
-    """Run the test suite, reading options from the command line.
+def optional_value(args, option, default):
+    """Give an option a default value if it appears without one.
 
-    The root of the test suite is the directory specified by 'root',
-    and the 'exec_paths' parameter specifies a list of directories to
-    search for executables.
+    The optparse module does not support options with optional
+    values, so '--option' is rewritten as '--option=default'.  Raises
+    OptionValueError if the option is followed by an argument which
+    is not a test pattern, since it was probably meant as the value.
     """
+    result = []
+    for i, arg in enumerate(args):
+        if arg == '--':
+            result.extend(args[i:])
+            break
+        if arg == option:
+            if i + 1 < len(args):
+                value = args[i + 1]
+                if (not value.startswith('-') and
+                    not idiotest.sglob.is_valid(value)):
+                    raise optparse.OptionValueError(
+                        '%s takes an optional value, use %s=%s' %
+                        (option, option, value))
+            arg = '%s=%s' % (option, default)
+        result.append(arg)
+    return result
+
+def make_parser():
+    """Make the command-line option parser."""
     parser = optparse.OptionParser()
     parser.add_option("-w", "--wrap", dest="wrap",
                       help="wrap commands with CMD", metavar="CMD")
@@ -26,13 +55,220 @@ def run(root='.', exec_paths=()):
     parser.add_option("--exec-path", dest='exec_paths',
                       help="add PATH to search path for executables",
                       action="append", default=[])
-    (options, args) = parser.parse_args()
+    parser.add_option("--memo-size", dest="memo_size",
+                      help="cache up to MB of memoized program output",
+                      type="int", default=64, metavar="MB")
+    parser.add_option("--durations", dest="durations",
+                      help="list the N slowest modules and tests",
+                      type="int", default=0, metavar="N")
+    parser.add_option("--profile", dest="profile",
+                      help="profile the harness, saving results in DIR",
+                      metavar="DIR")
+    parser.add_option("--trace", dest="trace",
+                      help="write trace events to FILE",
+                      metavar="FILE")
+    parser.add_option("--select-from", dest="select_from",
+                      help="run tests matching patterns listed in FILE",
+                      action="append", default=[], metavar="FILE")
+    parser.add_option("-x", "--exclude", dest="exclude",
+                      help="do not run tests matching PATTERN",
+                      action="append", default=[], metavar="PATTERN")
+    parser.add_option("--collect-only", dest="collect_only",
+                      help="list the selected tests without running them",
+                      action="store_true", default=False)
+    parser.add_option("--fixture-cache", dest="fixture_cache",
+                      help="store cached fixture values in DIR",
+                      metavar="DIR")
+    parser.add_option("--scratch", dest="scratch",
+                      help="run each test's programs in a private "
+                      "directory under ROOT", metavar="ROOT")
+    parser.add_option("--coordinator", dest="coordinator",
+                      help="serve tests to workers, listening on ADDR",
+                      metavar="HOST:PORT")
+    parser.add_option("--worker", dest="worker",
+                      help="run tests for the coordinator at ADDR",
+                      metavar="HOST:PORT")
+    parser.add_option("--daemon", dest="daemon",
+                      help="serve test runs on the Unix socket SOCKET",
+                      metavar="SOCKET")
+    parser.add_option("--journal", dest="journal",
+                      help="record each test result in FILE",
+                      metavar="FILE")
+    parser.add_option("--resume", dest="resume",
+                      help="skip tests which passed according to the journal",
+                      action="store_true", default=False)
+    parser.add_option("--history", dest="history",
+                      help="record test durations and results in FILE",
+                      metavar="FILE")
+    parser.add_option("--history-report", dest="history_report",
+                      help="list slower and flaky tests from the history",
+                      action="store_true", default=False)
+    parser.add_option("--deps", dest="deps",
+                      help="record the files each test uses in FILE",
+                      metavar="FILE")
+    parser.add_option("--affected-by", dest="affected_by",
+                      help="run only tests which use files in PATHS",
+                      action="append", default=[], metavar="PATHS")
+    parser.add_option("--repeat", dest="repeat",
+                      help="run each selected test N times and report "
+                      "latency and throughput", type="int", default=0,
+                      metavar="N")
+    parser.add_option("--concurrency", dest="concurrency",
+                      help="with --repeat, run up to M copies at once",
+                      type="int", default=1, metavar="M")
+    return parser
+
+def parse_args(argv, exec_paths=()):
+    """Parse command-line arguments, returning (options, args)."""
+    parser = make_parser()
+    try:
+        argv = optional_value(argv, '--profile', 'idiotest-profile')
+        argv = optional_value(argv, '--scratch',
+                              idiotest.scratch.default_root())
+    except optparse.OptionValueError, ex:
+        parser.error(str(ex))
+    (options, args) = parser.parse_args(argv)
+    if options.resume and not options.journal:
+        parser.error('--resume requires --journal')
+    if options.history_report and not options.history:
+        parser.error('--history-report requires --history')
+    if options.affected_by and not options.deps:
+        parser.error('--affected-by requires --deps')
+    check_modes(parser, options, args)
     options.exec_paths.extend(exec_paths)
+    return options, args
+
+def check_modes(parser, options, args):
+    """Reject options which the selected mode would ignore."""
+    recording = [('--profile', options.profile),
+               ('--journal', options.journal),
+               ('--history', options.history),
+               ('--deps', options.deps),
+               ('--durations', options.durations)]
+    if options.coordinator and options.worker:
+        parser.error('--coordinator cannot be used with --worker')
+    if options.coordinator:
+        for name, value in [('--profile', options.profile),
+                            ('--repeat', options.repeat)]:
+            if value:
+                parser.error('%s cannot be used with --coordinator' % name)
+    if options.worker:
+        selection = [('--select-from', options.select_from),
+                     ('--exclude', options.exclude),
+                     ('test patterns', args)]
+        for name, value in recording + selection:
+            if value:
+                parser.error('%s cannot be used with --worker, '
+                             'give it to the coordinator' % name)
+    elif options.repeat:
+        for name, value in recording:
+            if value:
+                parser.error('%s cannot be used with --repeat' % name)
+
+def selection_patterns(options, args):
+    """Get the patterns for selecting tests, as (include, exclude).
+
+    Either list is None if no patterns of that kind were given.
+    """
+    include = list(args)
+    for path in options.select_from:
+        include.extend(idiotest.sglob.read_patterns(path))
+    if not include and not options.select_from:
+        include = None
+    exclude = options.exclude or None
+    return include, exclude
+
+def make_filter(options, args):
+    """Make the filter for selecting tests, or None to run all tests."""
+    return idiotest.sglob.make_selection(*selection_patterns(options, args))
+
+def run(root='.', exec_paths=()):
+    """Run the test suite, reading options from the command line.
+
+    The root of the test suite is the directory specified by 'root',
+    and the 'exec_paths' parameter specifies a list of directories to
+    search for executables.
+    """
+    options, args = parse_args(sys.argv[1:], exec_paths)
+    if options.daemon:
+        idiotest.daemon.serve(options.daemon, root, exec_paths)
+        return
+    run_options(options, args, root)
+
+def run_options(options, args, root, suite=None):
+    """Run the test suite with parsed command-line options.
+
+    If 'suite' is not None, it is the test suite in 'root', already
+    scanned.
+    """
+    if options.history_report:
+        idiotest.history.print_report(options.history)
+        return
     env = idiotest.env.make_env(options)
-    if args:
-        filter = idiotest.sglob.SGlob(args)
+    filter = make_filter(options, args)
+    if options.deps:
+        deps = idiotest.deps.load(options.deps)
+        if options.affected_by:
+            filter = idiotest.deps.Affected(
+                deps, idiotest.deps.read_paths(options.affected_by), filter)
+    if options.trace:
+        tracer = idiotest.trace.Tracer(options.trace)
+        idiotest.trace.install(tracer)
     else:
-        filter = None
-    suite = idiotest.suite.Suite(root)
-    suite.scan()
-    idiotest.console.run_suite(suite, env, filter)
+        tracer = None
+    journal = None
+    history = None
+    recorder = None
+    try:
+        if suite is None:
+            suite = idiotest.suite.Suite(root, options.fixture_cache)
+            suite.scan()
+        elif options.fixture_cache:
+            suite.cache_dir = options.fixture_cache
+        if options.collect_only:
+            idiotest.collect.list_tests(suite, env, filter)
+            return
+        if options.worker:
+            idiotest.distrib.run_worker(suite, env, options.worker)
+            return
+        if options.repeat:
+            idiotest.stress.run_stress(suite, env, filter, options.repeat,
+                                       options.concurrency)
+            return
+        observers = []
+        if options.profile:
+            observers.append(idiotest.profiler.Profiler(options.profile))
+        passed = ()
+        if options.journal:
+            journal = idiotest.journal.Journal(
+                options.journal, idiotest.journal.fingerprint(suite),
+                options.resume)
+            observers.append(journal)
+            passed = journal.passed
+        if options.history:
+            history = idiotest.history.History(options.history)
+            observers.append(history)
+        if options.deps:
+            recorder = idiotest.deps.Recorder(options.deps, deps,
+                                              env['proc'].usage)
+            observers.append(recorder)
+        if options.coordinator:
+            idiotest.distrib.run_coordinator(
+                suite, filter, options.coordinator,
+                durations=options.durations, observers=observers,
+                passed=passed, usage=env['proc'].usage)
+        else:
+            idiotest.console.run_suite(suite, env, filter,
+                                       durations=options.durations,
+                                       observers=observers, passed=passed)
+    finally:
+        if journal is not None:
+            journal.close()
+        if history is not None:
+            history.close()
+        if recorder is not None:
+            recorder.close()
+        env['proc'].close()
+        if tracer is not None:
+            idiotest.trace.install(None)
+            tracer.close()
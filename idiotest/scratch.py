@@ -0,0 +1,228 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest scratch directories.
+
+In scratch mode, each test gets a private working directory for the
+programs it runs, so tests which write files do not collide.  The
+directories are created under a scratch root, which should be on a
+fast file system such as tmpfs.
+
+Each scratch directory starts with a copy of the module's data files:
+the files in the module's directory other than test modules, and any
+subdirectories which contain no test modules.  The data files are
+copied once per directory into a template, and each scratch
+directory gets its own copy of the template, so a test can modify
+the files without affecting other tests.  The copies share blocks
+with the template on file systems which support reflinks.
+
+Scratch directories are created the first time a test runs a
+program, and are deleted in the background after the test finishes.
+
+Fixtures get their own scratch directory for their scope, created
+the same way, which lasts until the scope ends.  If a module fixture
+creates files in its directory, each test in the module starts with
+a copy of those files as well as the data files.  Files created by
+session fixtures are not copied; a session fixture should return
+their paths instead.
+"""
+from __future__ import absolute_import
+import os
+import re
+import errno
+import fcntl
+import shutil
+import stat
+import tempfile
+import threading
+import Queue
+import idiotest.suite
+import idiotest.fixture
+
+def default_root():
+    """Get the default scratch root, preferring tmpfs."""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def is_data(name):
+    return not (name.startswith('.') or name.endswith('.py')
+                or name.endswith('.pyc'))
+
+def has_modules(path):
+    for name in os.listdir(path):
+        if name.endswith('.py') and not name.startswith('.'):
+            return True
+    return False
+
+# Linux ioctl for cloning a file's blocks
+FICLONE = 0x40049409
+
+def copy_file(src, dest):
+    """Copy a file, with a reflink if the file system supports it."""
+    sfp = open(src, 'rb')
+    try:
+        dfp = open(dest, 'wb')
+        try:
+            try:
+                fcntl.ioctl(dfp.fileno(), FICLONE, sfp.fileno())
+            except (IOError, OSError):
+                shutil.copyfileobj(sfp, dfp, 1024 * 1024)
+        finally:
+            dfp.close()
+    finally:
+        sfp.close()
+    shutil.copystat(src, dest)
+
+def copy_data(src, dest):
+    """Copy data files from src to dest."""
+    for name in os.listdir(src):
+        if not is_data(name):
+            continue
+        spath = os.path.join(src, name)
+        dpath = os.path.join(dest, name)
+        if os.path.isdir(spath):
+            if has_modules(spath):
+                continue
+            os.mkdir(dpath)
+            copy_data(spath, dpath)
+        elif os.path.isfile(spath):
+            copy_file(spath, dpath)
+
+def copy_tree(src, dest):
+    """Populate dest with copies of the files in src."""
+    for name in os.listdir(src):
+        spath = os.path.join(src, name)
+        dpath = os.path.join(dest, name)
+        if os.path.isdir(spath) and not os.path.islink(spath):
+            os.mkdir(dpath)
+            copy_tree(spath, dpath)
+        elif os.path.islink(spath):
+            os.symlink(os.readlink(spath), dpath)
+        else:
+            copy_file(spath, dpath)
+
+def remove_tree(path):
+    """Remove a directory tree, including read-only directories."""
+    def onerror(func, path, exc_info):
+        parent = os.path.dirname(path)
+        try:
+            os.chmod(parent, stat.S_IRWXU)
+            func(path)
+        except OSError:
+            pass
+    shutil.rmtree(path, onerror=onerror)
+
+UNSAFE = re.compile('[^A-Za-z0-9_.-]+')
+
+class Scratch(object):
+    """Creates and deletes per-test scratch directories.
+
+    The directories are created under a new temporary directory inside
+    'root'.  Call 'close' when the test run is finished.
+    """
+
+    def __init__(self, root):
+        self.root = tempfile.mkdtemp(prefix='idiotest-', dir=root)
+        self.templates = {}
+        self.lock = threading.Lock()
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self.remove_loop)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def template(self, path):
+        """Get the template directory for a module directory."""
+        self.lock.acquire()
+        try:
+            try:
+                return self.templates[path]
+            except KeyError:
+                pass
+            template = tempfile.mkdtemp(prefix='template-', dir=self.root)
+            copy_data(path, template)
+            self.templates[path] = template
+            return template
+        finally:
+            self.lock.release()
+
+    def directory(self, test):
+        """Get the scratch directory for a test, creating it if necessary."""
+        path = getattr(test, 'scratch_dir', None)
+        if path is not None:
+            return path
+        dirpath = os.path.dirname(test.module.path)
+        fixtures = getattr(test.module, 'fixtures', None)
+        template = None
+        if fixtures is not None:
+            # Start with the files made by the module's fixtures
+            self.lock.acquire()
+            try:
+                template = fixtures.module.scratch_dirs.get(dirpath)
+            finally:
+                self.lock.release()
+        if template is None:
+            template = self.template(dirpath)
+        prefix = UNSAFE.sub('_', test.fullname)[:64] + '-'
+        path = tempfile.mkdtemp(prefix=prefix, dir=self.root)
+        copy_tree(template, path)
+        test.scratch_dir = path
+        def discard():
+            test.scratch_dir = None
+            self.queue.put(path)
+        test.add_cleanup(discard)
+        return path
+
+    def scope_directory(self, scope, fixture):
+        """Get the scratch directory for a fixture, creating it if necessary.
+
+        Fixtures from the same directory share a scratch directory for
+        their scope.
+        """
+        dirpath = os.path.dirname(fixture.path)
+        self.lock.acquire()
+        try:
+            path = scope.scratch_dirs.get(dirpath)
+        finally:
+            self.lock.release()
+        if path is not None:
+            return path
+        template = self.template(dirpath)
+        path = tempfile.mkdtemp(prefix='fixture-%s-' % (scope.name,),
+                                dir=self.root)
+        copy_tree(template, path)
+        self.lock.acquire()
+        try:
+            scope.scratch_dirs[dirpath] = path
+        finally:
+            self.lock.release()
+        def discard():
+            scope.scratch_dirs.pop(dirpath, None)
+            self.queue.put(path)
+        scope.add_cleanup(discard)
+        return path
+
+    def current(self):
+        """Get the scratch directory for the running fixture or test.
+
+        Returns None outside of fixtures and tests.
+        """
+        scope, fixture = idiotest.fixture.current()
+        if scope is not None:
+            return self.scope_directory(scope, fixture)
+        test = idiotest.suite.current_test()
+        if test is None:
+            return None
+        return self.directory(test)
+
+    def remove_loop(self):
+        while True:
+            path = self.queue.get()
+            if path is None:
+                break
+            remove_tree(path)
+
+    def close(self):
+        """Wait for scratch directories to be deleted, and delete the root."""
+        self.queue.put(None)
+        self.thread.join()
+        remove_tree(self.root)
@@ -1,45 +1,61 @@
 # Copyright 2009 Dietrich Epp <depp@zdome.net>
 # See LICENSE.txt for details.
+"""IdioTest name patterns.
+
+Patterns are compiled into a single trie, one level per name
+component.  Literal components are found with a dictionary lookup, so
+matching cost does not grow with the number of literal patterns.
+"""
 from __future__ import absolute_import
-__all__ = ['SGlob']
+__all__ = ['SGlob', 'Selection', 'make_selection', 'read_patterns']
 import re
 
 VALID_PART = re.compile('[A-Za-z_0-9?*]*$')
 MULTI_PART = re.compile('.*\\*\\*')
+WILD_PART = re.compile('[?*]')
 
-class Part(object):
-    def __init__(self, regexp):
-        self.regexp = regexp
+class Node(object):
+    """A node in the pattern trie.
 
-class SimplePart(Part):
-    def prefix_match(self, val):
-        if not val:
-            return True
-        if self.regexp.match(val[0]):
-            return self.next.prefix_match(val[1:])
-        return False
-    def full_match(self, val):
-        if not val:
-            return False
-        if self.regexp.match(val[0]):
-            return self.next.full_match(val[1:])
-        return False
+    literal: map from literal components to child nodes
+    globs: list of (regexp, node) for components with wildcards
+    multis: list of (regexp, node) for components which can match
+        multiple name components
+    end: True if a pattern ends at this node
+    """
+    __slots__ = ['literal', 'globs', 'multis', 'end', 'index']
 
-class MultiPart(Part):
-    def prefix_match(self, val):
-        return True
-    def full_match(self, val):
-        for n in xrange(len(val) + 1):
-            if (self.regexp.match('.'.join(val[:n]))
-                and self.next.full_match(val[:n])):
-                return True
-        return False
+    def __init__(self):
+        self.literal = {}
+        self.globs = []
+        self.multis = []
+        self.end = False
+        self.index = {}
 
-class EndPart(object):
-    def prefix_match(self, val):
-        return True
-    def full_match(self, val):
-        return True
+    def child(self, part):
+        """Get or create the child node for a pattern component."""
+        try:
+            return self.index[part]
+        except KeyError:
+            pass
+        node = Node()
+        self.index[part] = node
+        if not WILD_PART.search(part):
+            self.literal[part] = node
+        elif MULTI_PART.match(part):
+            self.multis.append((_mkregexp(part), node))
+        else:
+            self.globs.append((_mkregexp(part), node))
+        return node
+
+    def step(self, part, out):
+        """Append the nodes reached by matching a single component."""
+        node = self.literal.get(part)
+        if node is not None:
+            out.append(node)
+        for regexp, node in self.globs:
+            if regexp.match(part):
+                out.append(node)
 
 STAR = re.compile('\\*+')
 QMARK = re.compile('\\?')
@@ -49,35 +65,120 @@ def _starsub(m):
         return '.*'
     return '[^.]*'
 
-def _mkpart(p):
-    if not VALID_PART.match(p):
-        raise Exception('Invalid pattern: %s' % repr(p))
-    regexp = STAR.sub(_starsub, p);
+def _mkregexp(p):
+    regexp = STAR.sub(_starsub, p)
     regexp = QMARK.sub('[^.]', regexp)
-    regexp = re.compile(regexp + '$')
-    if MULTI_PART.match(p):
-        return MultiPart(regexp)
-    return SimplePart(regexp)
-
-def _mkpat(str):
-    ps = [_mkpart(p) for p in str.split('.')]
-    e = EndPart()
-    while ps:
-        p = ps.pop()
-        p.next = e
-        e = p
-    return e
+    return re.compile(regexp + '$')
+
+def _full_match(nodes, parts, pos):
+    """Test whether any pattern matches a prefix of parts[pos:]."""
+    n = len(parts)
+    while nodes:
+        nxt = []
+        for node in nodes:
+            if node.end:
+                return True
+            for regexp, child in node.multis:
+                for end in xrange(pos, n + 1):
+                    if (regexp.match('.'.join(parts[pos:end]))
+                        and _full_match([child], parts, end)):
+                        return True
+            if pos < n:
+                node.step(parts[pos], nxt)
+        nodes = nxt
+        pos += 1
+    return False
+
+def is_valid(pattern):
+    """Test whether a string is a valid pattern."""
+    for p in pattern.split('.'):
+        if not VALID_PART.match(p):
+            return False
+    return True
 
 class SGlob(object):
+    """A set of patterns for matching test and module names.
+
+    Names and patterns are split into components at '.'.  In a
+    pattern component, '?' matches any character, '*' matches any
+    sequence of characters, and '**' matches any sequence of
+    characters including '.'.
+    """
+
     def __init__(self, strs):
-        self.pats = [_mkpat(s) for s in strs]
+        self.root = Node()
+        for s in strs:
+            node = self.root
+            for p in s.split('.'):
+                if not VALID_PART.match(p):
+                    raise Exception('Invalid pattern: %s' % repr(p))
+                node = node.child(p)
+            node.end = True
+
     def prefix_match(self, str):
-        parts = str.split('.')
-        for pat in self.pats:
-            if pat.prefix_match(parts):
-                return True
+        """Test whether a name could be a prefix of a matching name.
+
+        This is used to decide whether a module or test should run.
+        """
+        nodes = [self.root]
+        for part in str.split('.'):
+            nxt = []
+            for node in nodes:
+                if node.end or node.multis:
+                    return True
+                node.step(part, nxt)
+            if not nxt:
+                return False
+            nodes = nxt
+        return True
+
     def full_match(self, str):
-        parts = str.split('.')
-        for pat in self.pats:
-            if pat.full_match(parts):
-                return True
+        """Test whether a pattern matches the name or one of its prefixes."""
+        return _full_match([self.root], str.split('.'), 0)
+
+class Selection(object):
+    """A selection of tests, with patterns to include and exclude.
+
+    If 'include' is None, all names are included.  The 'exclude'
+    patterns remove names and everything underneath them.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = include
+        self.exclude = exclude
+
+    def prefix_match(self, str):
+        if self.exclude is not None and self.exclude.full_match(str):
+            return False
+        if self.include is None:
+            return True
+        return self.include.prefix_match(str)
+
+def make_selection(include, exclude):
+    """Make a selection from lists of patterns.
+
+    Either list may be None.  Returns None if both are None.
+    """
+    if include is None and exclude is None:
+        return None
+    if include is not None:
+        include = SGlob(include)
+    if exclude is not None:
+        exclude = SGlob(exclude)
+    return Selection(include, exclude)
+
+def read_patterns(path):
+    """Read a list of patterns from a file, one per line.
+
+    Blank lines and lines starting with '#' are ignored.
+    """
+    pats = []
+    fp = open(path, 'r')
+    try:
+        for line in fp:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                pats.append(line)
+    finally:
+        fp.close()
+    return pats
@@ -0,0 +1,301 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest streaming input and output.
+
+Input and reference output files can be compressed with gzip, bzip2,
+or xz, and are decompressed as they are read.  Programs get their
+input from a file object one chunk at a time, and their output is
+compared with the reference output one chunk at a time as it arrives,
+so neither is ever held in memory in full.  Only a bounded prefix of
+the output, and the bytes around the first few differences, are kept
+for the failure report.
+"""
+from __future__ import absolute_import
+import os
+import gzip
+import bz2
+import codecs
+import difflib
+import idiotest.bindiff
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+CHUNK = 64 * 1024
+
+# Compressed file suffixes, in the order they are tried
+SUFFIXES = ['.gz', '.bz2', '.xz']
+
+def open(path):
+    """Open a file for reading, decompressing it if necessary.
+
+    The compression format is chosen by the file name suffix.
+    """
+    if path.endswith('.gz'):
+        return gzip.GzipFile(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    if path.endswith('.xz'):
+        if lzma is None:
+            raise Exception('cannot read %s: the lzma module is not '
+                            'available' % (path,))
+        return lzma.LZMAFile(path, 'rb')
+    return file(path, 'rb')
+
+def strip_suffix(name):
+    """Remove a compressed file suffix from a file name."""
+    for suffix in SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def find(path):
+    """Find a file, or a compressed version of it.
+
+    Returns 'path' if no such file exists.
+    """
+    if os.path.exists(path):
+        return path
+    for suffix in SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path
+
+def read_chunk(obj, size=CHUNK):
+    """Read a chunk from a file object, encoding unicode as UTF-8."""
+    data = obj.read(size)
+    if isinstance(data, unicode):
+        data = data.encode('UTF-8')
+    return data
+
+class TextCheck(object):
+    """Tests whether a stream is text, one chunk at a time.
+
+    The test is the same as bindiff.is_text: the stream is text if it
+    is UTF-8 without NUL bytes.
+    """
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('UTF-8')()
+        self.text = True
+
+    def feed(self, data, final=False):
+        if not self.text:
+            return
+        if '\x00' in data:
+            self.text = False
+            return
+        try:
+            self.decoder.decode(data, final)
+        except UnicodeDecodeError:
+            self.text = False
+
+class Region(object):
+    """The bytes around a difference between two streams.
+
+    The windows start at offset 'base' in both streams.  If 'partial'
+    is true, the windows start in the middle of a line.
+    """
+
+    def __init__(self, offset, line, before, partial):
+        self.offset = offset
+        self.line = line
+        self.base = offset - len(before)
+        self.partial = partial
+        self.window = before
+        self.ewindow = before
+
+def text_lines(data):
+    """Split part of a text stream into lines for difflib."""
+    lines = data.decode('UTF-8', 'replace').splitlines(True)
+    return [line if line.endswith(u'\n') else line + u'\n'
+            for line in lines]
+
+class StreamCompare(object):
+    """Compares program output with a reference stream as it arrives.
+
+    Call 'feed' with each chunk of output and 'finish' at the end of
+    the output.  The first 'limit' bytes of each stream are kept, and
+    'context' bytes on each side of the first 'count' differences.
+    After each difference, the next 2 * 'context' bytes are not
+    examined, the same as bindiff.write_diff.
+    """
+
+    def __init__(self, expected, limit=idiotest.bindiff.LIMIT, count=3,
+                 context=32):
+        self.expected = expected
+        self.limit = limit
+        self.count = count
+        self.context = context
+        self.head = []
+        self.ehead = []
+        self.nhead = 0
+        self.nehead = 0
+        self.pending = ''
+        self.length = 0
+        self.elength = 0
+        self.eof = False
+        self.text = TextCheck()
+        self.etext = TextCheck()
+        # Equal bytes before the current position, for context, and
+        # the byte before them
+        self.tail = ''
+        self.lines = 0
+        self.regions = []
+        # Bytes of context still needed after the last difference
+        self.need = 0
+        # Bytes to pass over before looking for the next difference
+        self.skip = 0
+
+    def read_more(self, size=CHUNK):
+        """Read a chunk of expected output, keeping the prefix."""
+        chunk = read_chunk(self.expected, size)
+        if not chunk:
+            self.eof = True
+            return chunk
+        self.elength += len(chunk)
+        self.etext.feed(chunk)
+        if self.nehead < self.limit:
+            part = chunk[:self.limit - self.nehead]
+            self.ehead.append(part)
+            self.nehead += len(part)
+        return chunk
+
+    def read_expected(self, size):
+        """Read up to 'size' bytes of expected output."""
+        data = self.pending
+        while len(data) < size:
+            chunk = self.read_more(max(size - len(data), CHUNK))
+            if not chunk:
+                break
+            data += chunk
+        self.pending = data[size:]
+        return data[:size]
+
+    def feed(self, data):
+        """Compare the next chunk of program output."""
+        if self.nhead < self.limit:
+            part = data[:self.limit - self.nhead]
+            self.head.append(part)
+            self.nhead += len(part)
+        self.text.feed(data)
+        offset = self.length
+        self.length += len(data)
+        expected = self.read_expected(len(data))
+        pos = 0
+        while pos < len(data):
+            if self.need:
+                end = min(pos + self.need, len(data))
+                region = self.regions[-1]
+                region.window += data[pos:end]
+                region.ewindow += expected[pos:end]
+                self.need -= end - pos
+            if self.skip:
+                end = min(pos + self.skip, len(data))
+                self.advance(data, pos, end)
+                self.skip -= end - pos
+                pos = end
+                continue
+            if len(self.regions) >= self.count:
+                break
+            diff = None
+            if not self.eof or offset + pos <= self.elength:
+                diff = idiotest.bindiff.first_difference(expected, data, pos)
+            if diff is None:
+                self.advance(data, pos, len(data))
+                break
+            self.advance(data, pos, diff)
+            self.add_region(offset + diff, '')
+            pos = diff
+            self.need = self.context
+            self.skip = self.context * 2
+
+    def advance(self, data, start, end):
+        """Pass over data[start:end], counting lines and keeping context."""
+        self.lines += data.count('\n', start, end)
+        size = self.context + 1
+        self.tail = (self.tail + data[max(start, end - size):end])[-size:]
+
+    def add_region(self, offset, extra):
+        before = self.tail[-self.context:]
+        partial = self.tail[:-self.context] not in ('', '\n')
+        region = Region(offset, self.lines + 1, before, partial)
+        region.ewindow += extra
+        self.regions.append(region)
+
+    def window_lines(self, region, data):
+        """Get the lines of a window for a text diff.
+
+        Partial lines at either end of the window are dropped, except
+        for the line with the difference.
+        """
+        pos = region.offset - region.base
+        start = 0
+        if region.partial:
+            start = data.find('\n', 0, pos) + 1
+        end = len(data)
+        if end - pos >= self.context:
+            end = data.rfind('\n', pos) + 1 or end
+        return text_lines(data[start:end])
+
+    def finish(self):
+        """Finish comparing, after the program output ends."""
+        self.text.feed('', True)
+        if self.need:
+            self.regions[-1].ewindow += self.read_expected(self.need)
+            self.need = 0
+        elif not self.skip and len(self.regions) < self.count:
+            extra = self.read_expected(self.context)
+            if extra:
+                self.add_region(self.length, extra)
+        while self.read_more():
+            pass
+        self.etext.feed('', True)
+
+    def equal(self):
+        return not self.regions and self.length == self.elength
+
+    def complete(self):
+        """Test whether both streams were kept in full."""
+        return self.length <= self.limit and self.elength <= self.limit
+
+    def output(self):
+        """Get the kept prefix of the program output."""
+        return ''.join(self.head)
+
+    def expected_output(self):
+        """Get the kept prefix of the expected output."""
+        return ''.join(self.ehead)
+
+    def write_report(self, file):
+        """Describe the differences between the streams.
+
+        If both streams are text, each difference is shown as a diff
+        of the lines around it, otherwise as a hex dump.
+        """
+        text = self.text.text and self.etext.text
+        file.write(u'=== output diff ===\n')
+        if self.length != self.elength:
+            file.write(u'expected %d bytes, got %d bytes\n' %
+                       (self.elength, self.length))
+        for region in self.regions:
+            file.write(u'difference at offset %d (0x%x), line %d:\n' %
+                       (region.offset, region.offset, region.line))
+            if text:
+                for line in difflib.Differ().compare(
+                        self.window_lines(region, region.ewindow),
+                        self.window_lines(region, region.window)):
+                    file.write(line)
+                continue
+            for title, data in ((u' expected:\n', region.ewindow),
+                                (u' got:\n', region.window)):
+                file.write(title)
+                if data:
+                    idiotest.bindiff.hexdump(data, 0, len(data), file,
+                                             base=region.base)
+                else:
+                    file.write(u'  <end of stream>\n')
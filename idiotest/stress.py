@@ -0,0 +1,212 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest stress mode.
+
+In stress mode, each selected test runs many times, with several
+copies running at once in separate threads.  Each copy is a shallow
+copy of the Test object, so each run gets its own timing, cleanups,
+and scratch directory, while sharing the module, its fixtures, and the
+ProcRunner.  Fixtures are evaluated once before the copies start.
+
+The report for each test gives the pass rate, the latency
+percentiles, and the throughput in runs and processes per second.
+Runs which were skipped are left out of the latencies and throughput.
+"""
+from __future__ import absolute_import
+import copy
+import sys
+import threading
+import traceback
+import idiotest.suite
+import idiotest.console
+import idiotest.timing
+import idiotest.exception
+
+hilite = idiotest.console.hilite
+FG_RED = idiotest.console.FG_RED
+FG_GREEN = idiotest.console.FG_GREEN
+BOLD = idiotest.console.BOLD
+
+def percentile(values, p):
+    """Get the p-th percentile of a sorted list, by nearest rank."""
+    if not values:
+        return 0.0
+    rank = int(len(values) * p / 100.0 + 0.5)
+    return values[min(max(rank, 1), len(values)) - 1]
+
+class Result(object):
+    """Outcomes of running one test many times.
+
+    This is also the callback object for the individual runs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.npass = 0
+        self.nfail = 0
+        self.nskip = 0
+        self.nproc = 0
+        self.latencies = []
+        self.failure = None
+        self.wall = 0.0
+
+    @property
+    def count(self):
+        return self.npass + self.nfail + self.nskip
+
+    def add(self, test, status, reason):
+        self.lock.acquire()
+        try:
+            if status == idiotest.suite.SUCCESS:
+                self.npass += 1
+            elif status == idiotest.suite.SKIP:
+                self.nskip += 1
+            else:
+                self.nfail += 1
+                if self.failure is None:
+                    self.failure = reason
+            timing = getattr(test, 'timing', None)
+            if timing is not None:
+                self.nproc += timing.nproc
+                if status != idiotest.suite.SKIP and timing.start is not None:
+                    self.latencies.append(timing.total)
+        finally:
+            self.lock.release()
+
+    def test_begin(self, test):
+        return True
+    def test_pass(self, test):
+        if test.fail:
+            self.add(test, idiotest.suite.FAIL, u'passed (expected failure)')
+        else:
+            self.add(test, idiotest.suite.SUCCESS, None)
+    def test_skip(self, test, reason):
+        self.add(test, idiotest.suite.SKIP, reason)
+    def test_fail(self, test, reason):
+        if test.fail:
+            self.add(test, idiotest.suite.SUCCESS, None)
+        else:
+            self.add(test, idiotest.suite.FAIL, reason)
+
+def stress_test(test, repeat, concurrency):
+    """Run a test 'repeat' times, with up to 'concurrency' at once."""
+    result = Result()
+    if test.params:
+        # Evaluate fixtures here, so the threads only read them
+        try:
+            test.module.fixtures.resolve(test.params)
+        except KeyboardInterrupt:
+            raise
+        except:
+            pass
+    lock = threading.Lock()
+    state = {'next': 0, 'stop': False}
+    def worker():
+        while True:
+            lock.acquire()
+            try:
+                if state['stop'] or state['next'] >= repeat:
+                    return
+                state['next'] += 1
+            finally:
+                lock.release()
+            run = copy.copy(test)
+            try:
+                run.run(result)
+            except idiotest.exception.TestException, ex:
+                result.add(run, idiotest.suite.FAIL, ex.get())
+            except:
+                result.add(run, idiotest.suite.FAIL, traceback.format_exc())
+    threads = [threading.Thread(target=worker)
+               for i in xrange(max(1, min(concurrency, repeat)))]
+    start = idiotest.timing.clock()
+    for thread in threads:
+        thread.setDaemon(True)
+        thread.start()
+    try:
+        for thread in threads:
+            # Join with a timeout so KeyboardInterrupt is delivered
+            while thread.isAlive():
+                thread.join(0.1)
+    except KeyboardInterrupt:
+        state['stop'] = True
+        raise
+    result.wall = idiotest.timing.clock() - start
+    return result
+
+def print_result(result):
+    count = result.count
+    print '    runs: %d, passed: %d (%.1f%%), failed: %d, skipped: %d' % (
+        count, result.npass, result.npass * 100.0 / count if count else 0.0,
+        result.nfail, result.nskip)
+    latencies = sorted(result.latencies)
+    print '    latency: p50 %.4fs, p90 %.4fs, p99 %.4fs, max %.4fs' % (
+        percentile(latencies, 50), percentile(latencies, 90),
+        percentile(latencies, 99), percentile(latencies, 100))
+    if result.wall > 0:
+        print '    throughput: %.1f runs/s, %.1f processes/s' % (
+            len(result.latencies) / result.wall, result.nproc / result.wall)
+    if result.failure is not None:
+        print '    first failure:'
+        idiotest.console.print_reason(result.failure, 6)
+
+class Stress(idiotest.suite.Callback):
+    """Callback object which runs each selected test many times.
+
+    Returns False from 'test_begin' after running the copies, so the
+    test itself does not run again.
+    """
+
+    def __init__(self, filter, repeat, concurrency):
+        self.repeat = repeat
+        self.concurrency = concurrency
+        self.ntests = 0
+        self.nfail = 0
+        self.nruns = 0
+        if filter is not None:
+            self.filter = filter.prefix_match
+        else:
+            self.filter = idiotest.console.const_true
+
+    def module_begin(self, module):
+        return idiotest.console.module_selected(self.filter, module)
+
+    def module_fail(self, module, reason):
+        print module.name
+        print '  %s' % hilite('MODULE FAILED', FG_RED, BOLD)
+        idiotest.console.print_reason(reason, 4)
+        self.nfail += 1
+
+    def test_begin(self, test):
+        if not self.filter(test.fullname):
+            return False
+        print test.fullname
+        result = stress_test(test, self.repeat, self.concurrency)
+        print_result(result)
+        print
+        self.ntests += 1
+        self.nruns += result.count
+        if result.nfail:
+            self.nfail += 1
+        return False
+
+    def print_summary(self):
+        print 'tests stressed: %d, runs: %d' % (self.ntests, self.nruns)
+        if self.nfail:
+            print 'tests with failures: %d' % (self.nfail,)
+            print 'test suite:', hilite('FAILED', FG_RED, BOLD)
+        else:
+            print 'test suite:', hilite('passed', FG_GREEN)
+
+    def success(self):
+        return self.nfail == 0
+
+def run_stress(suite, env, filter, repeat, concurrency=1):
+    """Run each selected test many times and print the results."""
+    obj = Stress(filter, repeat, concurrency)
+    suite.run(obj, env)
+    obj.print_summary()
+    if obj.success():
+        sys.exit(0)
+    else:
+        sys.exit(1)
@@ -26,19 +26,61 @@ tests in the module fail.
 The 'begin' function should return True if the module or test should
 be run and False if it should be skipped.  If the module or test is
 skipped, the 'skip' function will be called immediately.
+
+When the 'pass', 'skip', or 'fail' function is called, the module or
+test has a 'timing' attribute with an idiotest.timing.Timing object
+recording how long it took.
 """
 from __future__ import with_statement, absolute_import
 import os
 import sys
+import threading
 import idiotest.exception
+import idiotest.timing
+import idiotest.trace
+import idiotest.collect
+import idiotest.fixture
+import idiotest.golden
 import traceback
 
 TestException = idiotest.exception.TestException
+Timing = idiotest.timing.Timing
 
 SUCCESS = 'SUCCESS'
 SKIP = 'SKIP'
 FAIL = 'FAIL'
 
+_local = threading.local()
+
+def current_test():
+    """Get the test running in this thread, or None."""
+    return getattr(_local, 'test', None)
+
+_code_cache = {}
+
+def compile_file(path):
+    """Compile a test module.
+
+    The compiled code is cached until the file changes.
+    """
+    st = os.stat(path)
+    key = st.st_mtime, st.st_size
+    try:
+        ckey, code = _code_cache[path]
+    except KeyError:
+        pass
+    else:
+        if ckey == key:
+            return code
+    fp = open(path, 'rU')
+    try:
+        source = fp.read()
+    finally:
+        fp.close()
+    code = compile(source, path, 'exec')
+    _code_cache[path] = key, code
+    return code
+
 def relpath(basepath, path):
     if path == basepath:
         return '.'
@@ -54,6 +96,7 @@ class Test(object):
         self.name = name
         self.test = test
         self.fail = fail
+        self.params = idiotest.fixture.argnames(test)
 
     @property
     def fullname(self):
@@ -61,25 +104,150 @@ class Test(object):
 
     def run(self, obj):
         """Run test and pass result to the callback object. """
+        self.timing = Timing()
         if not obj.test_begin(self):
             obj.test_skip(self, None)
             return
+        self.cleanups = []
+        with self.timing:
+            prev = current_test()
+            _local.test = self
+            try:
+                status, reason = self.call()
+            finally:
+                _local.test = prev
+                error = self.cleanup()
+        if error is not None and status != FAIL:
+            status, reason = FAIL, error
+        if idiotest.trace.tracer is not None:
+            idiotest.trace.span(
+                'test', self.fullname, self.timing.start, self.timing.end,
+                {'status': status})
+        if status == SUCCESS:
+            obj.test_pass(self)
+        elif status == SKIP:
+            obj.test_skip(self, reason)
+        else:
+            obj.test_fail(self, reason)
+
+    def add_cleanup(self, func):
+        """Call a function after the test runs, even if it fails."""
+        self.cleanups.append(func)
+
+    def cleanup(self):
+        """Run the cleanup functions.
+
+        Returns a description of any errors, or None.
+        """
+        errors = []
+        cleanups = self.cleanups
+        while cleanups:
+            func = cleanups.pop()
+            try:
+                func()
+            except KeyboardInterrupt:
+                raise
+            except:
+                errors.append(traceback.format_exc())
+        if errors:
+            return u'cleanup failed\n' + u''.join(errors)
+        return None
+
+    def call(self):
+        """Call the test and return the status and reason.
+
+        Exceptions for failing or skipping the module will pass
+        through here.
+        """
         try:
-            self.test()
+            if self.params:
+                kw = self.module.fixtures.resolve(self.params)
+            else:
+                kw = {}
+            self.test(**kw)
         except TestException, ex:
             if ex.module:
                 raise
             if ex.skip:
-                obj.test_skip(self, ex.get())
+                return SKIP, ex.get()
             else:
-                obj.test_fail(self, ex.get())
+                return FAIL, ex.get()
         except KeyboardInterrupt:
             raise
         except:
-            reason = traceback.format_exc()
-            obj.test_fail(self, reason)
+            return FAIL, traceback.format_exc()
         else:
-            obj.test_pass(self)
+            return SUCCESS, None
+
+class Callback(object):
+    """Callback object which ignores all results.
+
+    Subclass this to observe only some of the results.
+    """
+    def module_begin(self, module):
+        return True
+    def module_pass(self, module):
+        pass
+    def module_skip(self, module, reason):
+        pass
+    def module_fail(self, module, reason):
+        pass
+    def test_begin(self, test):
+        return True
+    def test_pass(self, test):
+        pass
+    def test_skip(self, test, reason):
+        pass
+    def test_fail(self, test, reason):
+        pass
+
+class Broadcast(object):
+    """Callback object which passes results to several callback objects.
+
+    Modules and tests are run only if all of the callback objects
+    return True from the 'begin' function.
+    """
+    def __init__(self, objs):
+        self.objs = list(objs)
+    def module_begin(self, module):
+        result = True
+        for obj in self.objs:
+            if not obj.module_begin(module):
+                result = False
+        return result
+    def module_pass(self, module):
+        for obj in self.objs:
+            obj.module_pass(module)
+    def module_skip(self, module, reason):
+        for obj in self.objs:
+            obj.module_skip(module, reason)
+    def module_fail(self, module, reason):
+        for obj in self.objs:
+            obj.module_fail(module, reason)
+    def test_begin(self, test):
+        result = True
+        for obj in self.objs:
+            if not obj.test_begin(test):
+                result = False
+        return result
+    def test_pass(self, test):
+        for obj in self.objs:
+            obj.test_pass(test)
+    def test_skip(self, test, reason):
+        for obj in self.objs:
+            obj.test_skip(test, reason)
+    def test_fail(self, test, reason):
+        for obj in self.objs:
+            obj.test_fail(test, reason)
+
+def expand(tests):
+    """Iterate over tests, expanding groups of tests as they are reached."""
+    for test in tests:
+        if isinstance(test, Test):
+            yield test
+        else:
+            for subtest in test:
+                yield subtest
 
 def getname(obj):
     """Get the default name for a test."""
@@ -98,22 +266,25 @@ class Module(object):
         self.name = name
         self.path = path
 
-    def load(self, env):
+    def load(self, env, session=None):
         """Load a module and return the tests.
 
         Exceptions for failing or skipping the module will pass
         through here, you should call 'run' instead, which handles
-        them.
+        them.  The session is the idiotest.fixture.Scope for
+        session fixtures.
         """
         testnames = set()
         tests = []
-        def mktest(name, obj, **kw):
+        def newtest(name, obj, **kw):
             if name in testnames:
                 raise Exception('Duplicate test name: %r' % (name,))
             if not callable(obj):
                 raise Exception('Test %r not callable' % (name,))
             testnames.add(name)
-            tests.append(Test(self, name, obj, **kw))
+            return Test(self, name, obj, **kw)
+        def mktest(name, obj, **kw):
+            tests.append(newtest(name, obj, **kw))
             return obj
         def test(*arg, **kw):
             """Register a test.
@@ -150,10 +321,32 @@ class Module(object):
             else:
                 raise ValueError(
                     "'test' expects two or fewer positional arguments")
+        def golden_dir(path, args, name=None, **kw):
+            """Register a test for each case in a golden file directory.
+
+            Cases are found when the tests run.  See
+            idiotest.golden.GoldenDir for the keyword arguments.
+            """
+            path = os.path.join(os.path.dirname(self.path), path)
+            if name is None:
+                name = os.path.basename(os.path.normpath(path))
+            tests.append(idiotest.golden.GoldenDir(
+                newtest, env['proc'], path, args, name, **kw))
+        self.fixtures = idiotest.fixture.Fixtures(self.path, session)
         env = dict(env)
         env['test'] = test
-        execfile(self.path, env, env)
-        return tests
+        env['fixture'] = self.fixtures.fixture
+        env['golden_dir'] = golden_dir
+        exec compile_file(self.path) in env
+        return expand(tests)
+
+    def collect(self):
+        """Return the names of the tests in the module without loading it.
+
+        Returns None if the tests cannot be found without loading the
+        module.
+        """
+        return idiotest.collect.collect_file(self.path)
 
     def context(self):
         """Return the execution context for this module.
@@ -163,29 +356,71 @@ class Module(object):
         """
         return Context(self)
 
-    def run(self, obj, env):
+    def run(self, obj, env, session=None):
         """Run tests in the module, passing the results to obj."""
+        self.timing = Timing()
         if not obj.module_begin(self):
             obj.module_skip(self, None)
             return
         with self.context():
+            with self.timing:
+                status, reason = self.call(obj, env, session)
+        tracer = idiotest.trace.tracer
+        if tracer is not None:
+            tracer.span('module', self.name, self.timing.start,
+                        self.timing.end, {'status': status})
+            tracer.flush()
+        if status == SUCCESS:
+            obj.module_pass(self)
+        elif status == SKIP:
+            obj.module_skip(self, reason)
+        else:
+            obj.module_fail(self, reason)
+
+    def call(self, obj, env, session=None):
+        """Load and run the tests, returning the module status and reason.
+
+        This should be called inside the module's context.
+        """
+        self.fixtures = None
+        try:
+            status, reason = self.call_tests(obj, env, session)
+        finally:
+            if self.fixtures is not None:
+                error = self.fixtures.close()
+            else:
+                error = None
+        if error is not None and status != FAIL:
+            return FAIL, error
+        return status, reason
+
+    def call_tests(self, obj, env, session):
+        timing = self.timing
+        try:
+            start = idiotest.timing.clock()
             try:
-                for test in self.load(env):
-                    test.run(obj)
-            except TestException, ex:
-                if not ex.module:
-                    raise
-                if ex.skip:
-                    obj.module_skip(self, ex.get())
-                else:
-                    obj.module_fail(self, ex.get())
-            except KeyboardInterrupt:
+                tests = self.load(env, session)
+            finally:
+                end = idiotest.timing.clock()
+                timing.load = end - start
+                idiotest.trace.span('load', self.name, start, end,
+                                    {'path': self.path})
+            for test in tests:
+                test.run(obj)
+                timing.add(test.timing)
+        except TestException, ex:
+            if not ex.module:
                 raise
-            except:
-                reason = traceback.format_exc()
-                obj.module_fail(self, reason)
+            if ex.skip:
+                return SKIP, ex.get()
             else:
-                obj.module_pass(self)
+                return FAIL, ex.get()
+        except KeyboardInterrupt:
+            raise
+        except:
+            return FAIL, traceback.format_exc()
+        else:
+            return SUCCESS, None
 
 class Context(object):
     def __init__(self, module):
@@ -206,13 +441,21 @@ class Suite(object):
     executed in.
     """
 
-    def __init__(self, root):
-        """Create a suite of tests in the directory 'root'."""
+    def __init__(self, root, cache_dir=None):
+        """Create a suite of tests in the directory 'root'.
+
+        Cached fixture values are stored in 'cache_dir'.
+        """
         self.root = root
+        if cache_dir is None:
+            cache_dir = os.path.join(root, '.idiotest-cache')
+        self.cache_dir = cache_dir
 
     def scan(self):
         """Scan the root directory for test files."""
+        start = idiotest.timing.clock()
         modules = []
+        fixture_files = []
         for dirpath, dirnames, filenames in os.walk(self.root):
             dirnames[:] = [x for x in dirnames if not x.startswith('.')]
             if dirpath != self.root:
@@ -225,14 +468,41 @@ class Suite(object):
                 if f.startswith('.') or not f.endswith('.py'):
                     continue
                 abspath = os.path.join(absdirpath, f)
+                if f == idiotest.fixture.FIXTURE_FILE:
+                    fixture_files.append(abspath)
+                    continue
                 name = basename + f[:-3]
                 modules.append(Module(name, abspath))
         modules.sort(key=lambda m: m.name)
         self.modules = modules
+        fixture_files.sort()
+        self.fixture_files = fixture_files
+        idiotest.trace.span('scan', 'scan', start, idiotest.timing.clock(),
+                            {'root': self.root, 'modules': len(modules)})
         if not modules:
             raise Exception('No test modules were found.')
 
+    def session(self, env):
+        """Create the scope for session fixtures.
+
+        The fixture files are loaded into the new scope, so their
+        fixtures are available to every module.
+        """
+        session = idiotest.fixture.Scope('session', self.cache_dir)
+        for path in self.fixture_files:
+            fixtures = idiotest.fixture.Fixtures(path, session, 'session')
+            fenv = dict(env)
+            fenv['fixture'] = fixtures.fixture
+            exec compile_file(path) in fenv
+        return session
+
     def run(self, obj, env):
         """Run all tests in the suite, passing the results to obj."""
-        for module in self.modules:
-            module.run(obj, env)
+        session = self.session(env)
+        try:
+            for module in self.modules:
+                module.run(obj, env, session)
+        finally:
+            error = session.close()
+            if error is not None:
+                sys.stderr.write(error.encode('UTF-8') + '\n')
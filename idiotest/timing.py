@@ -0,0 +1,115 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest timing instrumentation.
+
+Every module and test which runs gets a Timing object, which records
+where the time went: loading the module, spawning processes, waiting
+for processes to finish, and comparing output.  The Timing object is
+available as the 'timing' attribute of modules and tests by the time
+the callback object receives the result.
+
+Timing objects are used as context managers.  While a timing object
+is active, processes which run in the same thread charge their time to
+it.
+"""
+from __future__ import absolute_import
+import sys
+import time
+import threading
+
+def _get_clock():
+    """Get a monotonic clock function, if possible."""
+    try:
+        return time.monotonic
+    except AttributeError:
+        pass
+    if sys.platform.startswith('linux'):
+        try:
+            import ctypes
+            class timespec(ctypes.Structure):
+                _fields_ = [('tv_sec', ctypes.c_long),
+                            ('tv_nsec', ctypes.c_long)]
+            libc = ctypes.CDLL(None, use_errno=True)
+            clock_gettime = libc.clock_gettime
+            clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        except (ImportError, OSError, AttributeError):
+            pass
+        else:
+            CLOCK_MONOTONIC = 1
+            def monotonic():
+                t = timespec()
+                if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)):
+                    return time.time()
+                return t.tv_sec + t.tv_nsec * 1e-9
+            return monotonic
+    return time.time
+
+clock = _get_clock()
+
+_local = threading.local()
+
+def current():
+    """Get the active timing object for this thread, or None."""
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+class Timing(object):
+    """Time spent running a single module or test, in seconds.
+
+    load: time spent loading the module
+    spawn: time spent creating processes
+    child: time spent waiting for processes to run
+    compare: time spent comparing process output
+    nproc: number of processes run
+    """
+
+    def __init__(self):
+        self.start = None
+        self.end = None
+        self.load = 0.0
+        self.spawn = 0.0
+        self.child = 0.0
+        self.compare = 0.0
+        self.nproc = 0
+
+    @property
+    def total(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+    @property
+    def harness(self):
+        """Time not accounted for by child processes."""
+        return self.total - self.spawn - self.child
+
+    def add(self, other):
+        """Add the process and comparison time from another object."""
+        self.spawn += other.spawn
+        self.child += other.child
+        self.compare += other.compare
+        self.nproc += other.nproc
+
+    def __enter__(self):
+        try:
+            stack = _local.stack
+        except AttributeError:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = clock()
+        _local.stack.pop()
+
+    def summary(self):
+        """Get a short description of where the time went."""
+        parts = []
+        for name in ('load', 'spawn', 'child', 'compare'):
+            value = getattr(self, name)
+            if value:
+                parts.append('%s %.3fs' % (name, value))
+        return ', '.join(parts)
@@ -0,0 +1,95 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""IdioTest trace event export.
+
+When a tracer is installed, the suite records spans for scanning,
+loading modules, running tests, and running processes.  The spans are
+written in the Trace Event Format, which can be viewed in Perfetto or
+chrome://tracing.  Events are written as they complete, and the
+viewers accept a file which is cut off before the closing bracket, so
+an interrupted run still produces a usable trace.
+"""
+from __future__ import absolute_import
+import os
+import threading
+import json
+import idiotest.timing
+
+clock = idiotest.timing.clock
+
+# The installed tracer, or None
+tracer = None
+
+class Tracer(object):
+    """Writes trace events to a file."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.file.write('[\n')
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.origin = clock()
+        self.first = True
+
+    def event(self, event):
+        try:
+            data = json.dumps(event, sort_keys=True)
+        except (UnicodeError, TypeError, ValueError):
+            # Tracing must never make a test fail, so write what we can
+            try:
+                data = json.dumps(event, sort_keys=True, encoding='latin-1',
+                                  default=repr)
+            except (UnicodeError, TypeError, ValueError):
+                return
+        self.lock.acquire()
+        try:
+            if self.first:
+                self.first = False
+            else:
+                self.file.write(',\n')
+            self.file.write(data)
+        finally:
+            self.lock.release()
+
+    def span(self, cat, name, start, end, args=None):
+        """Record a complete span, with times from the timing clock."""
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': int((start - self.origin) * 1e6),
+            'dur': int((end - start) * 1e6),
+            'pid': self.pid,
+            'tid': threading.current_thread().ident,
+        }
+        if args:
+            event['args'] = args
+        self.event(event)
+
+    def flush(self):
+        self.lock.acquire()
+        try:
+            self.file.flush()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.file.write('\n]\n')
+        self.file.close()
+
+def text(value):
+    """Convert a byte string to unicode for a trace event."""
+    if isinstance(value, str):
+        return value.decode('UTF-8', 'replace')
+    return value
+
+def install(obj):
+    """Install a tracer, or remove it if obj is None."""
+    global tracer
+    tracer = obj
+
+def span(cat, name, start, end, args=None):
+    """Record a span if a tracer is installed."""
+    obj = tracer
+    if obj is not None:
+        obj.span(cat, name, start, end, args)
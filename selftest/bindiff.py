@@ -0,0 +1,43 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import idiotest.bindiff
+import idiotest.proc
+
+first_difference = idiotest.bindiff.first_difference
+
+@test
+def bindiff_first():
+    a = ''.join([chr(i % 251) for i in xrange(200000)])
+    for pos in [0, 1, 65535, 65536, 100000, 199999]:
+        b = a[:pos] + '\xff' + a[pos+1:]
+        if first_difference(a, b) != pos:
+            fail('difference at %d not found' % (pos,))
+    if first_difference(a, a) is not None:
+        fail('difference found in equal strings')
+    if first_difference(a, a[:1000]) != 1000:
+        fail('length difference not found')
+
+@test
+def bindiff_many():
+    a = '\x00' * 10000
+    b = ''.join(['\x01' if i % 1000 == 5 else '\x00' for i in xrange(10000)])
+    offsets = idiotest.bindiff.differences(a, b, 3, 64)
+    if offsets != [5, 1005, 2005]:
+        fail('wrong differences: %r' % (offsets,))
+
+@test
+def bindiff_report():
+    data = '\x00\xff' * 100000
+    changed = data[:150001] + '\x01' + data[150002:]
+    p = proc.run(['cat'], input=data)
+    try:
+        p.check_output(changed)
+    except idiotest.proc.ProcOutputError, ex:
+        msg = ex.get()
+    else:
+        fail('output mismatch not detected')
+    for text in ['difference at offset 150001', '<binary, 200000 bytes>']:
+        if text not in msg:
+            fail('report does not contain %r:\n%s' % (text, msg))
+    if len(msg) > 4096:
+        fail('report is too long: %d bytes' % (len(msg),))
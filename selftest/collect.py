@@ -0,0 +1,28 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import idiotest.collect
+
+def check(source, names):
+    result = idiotest.collect.collect_source(source)
+    if result != names:
+        fail('expected %r, got %r' % (names, result))
+
+@test
+def static_names():
+    check('@test\ndef a(): pass\n', ['a'])
+    check('@test(fail=True)\ndef a(): pass\n', ['a'])
+    check('@test("Test #1")\ndef a(): pass\n', ['Test #1'])
+    check('class A(object): pass\ntest("b", A())\n', ['b'])
+
+@test
+def dynamic_names():
+    check('for i in range(3):\n    test(str(i), f)\n', None)
+    check('name = "a"\n@test(name)\ndef a(): pass\n', None)
+    check('t = test\n', None)
+
+@test
+def selftest_modules():
+    names = idiotest.collect.collect_file('demo.py')
+    if names != ['test_1', 'Test #2', 'Test #3', 'Test #4',
+                 'test_get_output', 'test_check_output']:
+        fail('wrong names for demo: %r' % (names,))
@@ -0,0 +1,6 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+
+@fixture
+def shared_text():
+    return proc.get_output(['cat', 'test1.txt'])
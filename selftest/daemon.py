@@ -0,0 +1,54 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(os.getcwd()))
+
+@fixture
+def daemon():
+    tempdir = tempfile.mkdtemp()
+    path = os.path.join(tempdir, 'socket')
+    devnull = open(os.devnull, 'w')
+    p = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'test.py'), '--daemon', path],
+        stderr=devnull)
+    deadline = time.time() + 10.0
+    while not os.path.exists(path):
+        if p.poll() is not None or time.time() > deadline:
+            fail('daemon did not start')
+        time.sleep(0.05)
+    yield path
+    p.terminate()
+    p.wait()
+    devnull.close()
+    exists = os.path.exists(path)
+    shutil.rmtree(tempdir)
+    if exists:
+        fail('daemon did not remove its socket')
+
+def client(path, *args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT
+    p = subprocess.Popen([sys.executable, '-m', 'idiotest.client', path]
+                         + list(args), stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE, env=env)
+    output = p.communicate()[0]
+    return p.returncode, output
+
+@test
+def daemon_run(daemon):
+    for i in xrange(2):
+        status, output = client(daemon, 'sglob')
+        if status != 0 or 'literal' not in output:
+            fail('daemon run failed (status %d):\n%s' % (status, output))
+
+@test
+def daemon_status(daemon):
+    status, output = client(daemon, '--no-such-option')
+    if status != 2:
+        fail('wrong exit status: %d' % (status,))
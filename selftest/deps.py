@@ -0,0 +1,95 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import StringIO
+import idiotest.deps
+import idiotest.fixture
+import idiotest.proc
+import idiotest.run
+import idiotest.suite
+
+@test
+def deps_record():
+    options, args = idiotest.run.parse_args(['--deps', 'unused.json'])
+    runner = idiotest.proc.ProcRunner(options)
+    runner.check_output(['cat', 'test1.txt'], output=file('test1.txt', 'rb'))
+    for i in xrange(2):
+        runner.get_output(['cat'], input=file('test2.in.txt', 'rb'),
+                          memo=True)
+    name = idiotest.suite.current_test().fullname
+    paths = runner.usage.get(name, set())
+    expected = [os.path.realpath(runner.find_executable('cat'))]
+    for fname in ['test1.txt', 'test2.in.txt']:
+        expected.append(os.path.realpath(fname))
+    for path in expected:
+        if path not in paths:
+            fail('dependency not recorded: %s\nrecorded: %r' % (path, paths))
+
+@test
+def deps_affected():
+    deps = {
+        'a.one': ['/bin/prog1', '/src/a.py'],
+        'a.two': ['/bin/prog2', '/src/a.py'],
+        'b.three': ['/data/x/input.txt', '/src/b.py'],
+    }
+    def selected(paths):
+        affected = idiotest.deps.Affected(deps, paths)
+        names = ['a.one', 'a.two', 'b.three', 'b.four']
+        return [name for name in names if affected.prefix_match(name)]
+    checks = [
+        (['/bin/prog1'], ['a.one', 'b.four']),
+        (['/src/a.py'], ['a.one', 'a.two', 'b.four']),
+        (['/data'], ['b.three', 'b.four']),
+        ([], ['b.four']),
+    ]
+    for paths, expected in checks:
+        result = selected(paths)
+        if result != expected:
+            fail('paths %r selected %r, expected %r' %
+                 (paths, result, expected))
+
+@test
+def deps_read_paths():
+    stdin = StringIO.StringIO('/a/b\n\n/c\n')
+    paths = idiotest.deps.read_paths(['/x' + os.pathsep + '/y', '-'], stdin)
+    if paths != ['/x', '/y', '/a/b', '/c']:
+        fail('wrong paths: %r' % (paths,))
+
+class FixtureModule(object):
+    def __init__(self, fixtures):
+        self.name = 'fake'
+        self.fixtures = fixtures
+
+class FixtureTest(object):
+    def __init__(self, module, name, params):
+        self.module = module
+        self.fullname = 'fake.' + name
+        self.params = params
+
+@test
+def deps_fixture():
+    options, args = idiotest.run.parse_args(['--deps', 'unused.json'])
+    runner = idiotest.proc.ProcRunner(options)
+    fixtures = idiotest.fixture.Fixtures(os.path.abspath('deps.py'))
+    def data():
+        runner.check_output(['cat', 'test1.txt'],
+                            output=file('test1.txt', 'rb'))
+    fixtures.fixture('data', data)
+    def wrapper(data):
+        pass
+    fixtures.fixture('wrapper', wrapper)
+    try:
+        fixtures.resolve(['wrapper'])
+        path = os.path.realpath('test1.txt')
+        name = idiotest.suite.current_test().fullname
+        if path in runner.usage.get(name, ()):
+            fail('fixture file charged to the running test')
+        module = FixtureModule(fixtures)
+        for test in [FixtureTest(module, 'one', ['data']),
+                     FixtureTest(module, 'two', ['wrapper'])]:
+            paths = idiotest.deps.test_paths(runner.usage, test)
+            if path not in paths:
+                fail('fixture file not recorded for %s: %r' %
+                     (test.fullname, paths))
+    finally:
+        fixtures.close()
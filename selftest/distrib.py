@@ -0,0 +1,223 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import json
+import os
+import re
+import signal
+import StringIO
+import subprocess
+import sys
+import tempfile
+import threading
+import idiotest.run
+import selftest_util
+
+ROOT = os.path.dirname(os.path.abspath(os.getcwd()))
+
+RUNNER = '''
+import idiotest.run, sys, os
+idiotest.run.run(os.path.join(sys.path[0], 'tests'))
+'''
+
+PASS = '''
+@test
+def works():
+    pass
+'''
+
+# Kills its worker the first time it runs, so the module is requeued
+KILL_ONCE = '''
+import os, signal
+MARKER = %r
+
+@test
+def killed():
+    if not os.path.exists(MARKER):
+        open(MARKER, 'w').close()
+        os.kill(os.getpid(), signal.SIGKILL)
+'''
+
+# Kills every worker which runs it
+KILL = '''
+import os, signal
+
+@test
+def killed():
+    os.kill(os.getpid(), signal.SIGKILL)
+'''
+
+CAT = '''
+@test
+def cat():
+    proc.check_output(['cat', 'data.txt'], output='data\\n')
+'''
+
+fixture(selftest_util.tempdir)
+
+def write(path, text):
+    fp = open(path, 'w')
+    try:
+        fp.write(text)
+    finally:
+        fp.close()
+
+def make_suite(tempdir, modules):
+    """Create a test suite with the given modules, returning its path."""
+    path = tempfile.mkdtemp(dir=tempdir)
+    os.mkdir(os.path.join(path, 'tests'))
+    write(os.path.join(path, 'run.py'), RUNNER)
+    for name, text in modules.items():
+        write(os.path.join(path, 'tests', name + '.py'), text)
+    return path
+
+def run_distrib(path, nworkers, options=()):
+    """Run a suite with a coordinator and workers.
+
+    The 'options' are given to the coordinator.  Returns the
+    coordinator's status and output, and the sorted worker statuses.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT
+    command = [sys.executable, os.path.join(path, 'run.py')]
+    coord = subprocess.Popen(
+        command + ['--coordinator', '127.0.0.1:0'] + list(options), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    procs = [coord]
+    # Do not wait forever if something goes wrong
+    def kill_all():
+        for p in procs:
+            if p.poll() is None:
+                p.kill()
+    timer = threading.Timer(60.0, kill_all)
+    timer.start()
+    try:
+        line = coord.stderr.readline()
+        m = re.search(r':(\d+)$', line.strip())
+        if m is None:
+            fail('coordinator did not start: %r' % (line,))
+        address = '127.0.0.1:' + m.group(1)
+        devnull = open(os.devnull, 'w')
+        try:
+            workers = [subprocess.Popen(command + ['--worker', address],
+                                        env=env, stdout=devnull,
+                                        stderr=devnull)
+                       for i in xrange(nworkers)]
+        finally:
+            devnull.close()
+        procs.extend(workers)
+        output = coord.communicate()[0]
+        statuses = sorted(p.wait() for p in workers)
+    finally:
+        timer.cancel()
+        kill_all()
+    return coord.returncode, output, statuses
+
+def check_passed(output, names):
+    for name in names:
+        module, test = name.split('.')
+        if not re.search(r'^%s\n  %s +\[  ok  \]$' % (module, test),
+                         output, re.M):
+            fail('test %s did not pass:\n%s' % (name, output))
+
+@test
+def distrib_requeue(tempdir):
+    marker = os.path.join(tempdir, 'marker')
+    path = make_suite(tempdir, {'a': PASS, 'b': KILL_ONCE % (marker,),
+                                'c': PASS, 'd': PASS})
+    status, output, statuses = run_distrib(path, 2)
+    if status != 0:
+        fail('coordinator failed (status %d):\n%s' % (status, output))
+    if statuses != [-signal.SIGKILL, 0]:
+        fail('wrong worker statuses: %r' % (statuses,))
+    if not os.path.exists(marker):
+        fail('killing test did not run')
+    check_passed(output, ['a.works', 'b.killed', 'c.works', 'd.works'])
+    if 'tests passed: 4' not in output:
+        fail('wrong summary:\n%s' % (output,))
+
+@test
+def distrib_attempts(tempdir):
+    path = make_suite(tempdir, {'a': PASS, 'b': KILL})
+    status, output, statuses = run_distrib(path, 3)
+    if status != 1:
+        fail('coordinator did not fail (status %d):\n%s' % (status, output))
+    if statuses != [-signal.SIGKILL] * 3:
+        fail('wrong worker statuses: %r' % (statuses,))
+    check_passed(output, ['a.works'])
+    text = "worker exited while running test 'killed' (tried 3 times)"
+    if text not in output or 'MODULE FAILED' not in output:
+        fail('module failure not reported:\n%s' % (output,))
+
+@test
+def distrib_no_workers(tempdir):
+    path = make_suite(tempdir, {'a': KILL, 'b': PASS})
+    status, output, statuses = run_distrib(path, 1)
+    if status != 1:
+        fail('coordinator did not fail (status %d):\n%s' % (status, output))
+    if output.count('no workers connected') != 2:
+        fail('unfinished modules not reported:\n%s' % (output,))
+
+@test
+def distrib_observers(tempdir):
+    path = make_suite(tempdir, {'a': CAT, 'b': PASS})
+    data = os.path.join(path, 'tests', 'data.txt')
+    write(data, 'data\n')
+    deps = os.path.join(path, 'deps.json')
+    journal = os.path.join(path, 'journal')
+    status, output, statuses = run_distrib(
+        path, 1, ['--deps', deps, '--journal', journal])
+    if status != 0:
+        fail('coordinator failed (status %d):\n%s' % (status, output))
+    fp = open(deps)
+    try:
+        recorded = json.load(fp)
+    finally:
+        fp.close()
+    if os.path.realpath(data) not in recorded.get('a.cat', ()):
+        fail('dependency not recorded: %r' % (recorded,))
+    fp = open(journal)
+    try:
+        text = fp.read()
+    finally:
+        fp.close()
+    for name in ['a.cat', 'b.works']:
+        if name not in text:
+            fail('%s not in journal:\n%s' % (name, text))
+    status, output, statuses = run_distrib(
+        path, 1, ['--deps', deps, '--affected-by', data])
+    if status != 0:
+        fail('coordinator failed (status %d):\n%s' % (status, output))
+    check_passed(output, ['a.cat'])
+    if 'tests passed: 1\n' not in output:
+        fail('unaffected test ran:\n%s' % (output,))
+
+def parse_error(args):
+    """Parse arguments which should be rejected, returning the message."""
+    stderr = sys.stderr
+    sys.stderr = StringIO.StringIO()
+    try:
+        try:
+            idiotest.run.parse_args(args)
+        except SystemExit, ex:
+            status = ex.code
+        else:
+            status = None
+        message = sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+    if status != 2:
+        fail('arguments not rejected: %r' % (args,))
+    return message
+
+@test
+def distrib_options():
+    checks = [
+        (['--coordinator=:0', '--repeat=2'], '--repeat'),
+        (['--coordinator=:0', '--profile'], '--profile'),
+        (['--worker=:0', '--journal=j'], '--journal'),
+        (['--worker=:0', 'sglob'], 'test patterns'),
+    ]
+    for args, name in checks:
+        message = parse_error(args)
+        if name not in message:
+            fail('wrong message for %r:\n%s' % (args, message))
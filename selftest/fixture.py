@@ -0,0 +1,111 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import sys
+import subprocess
+import idiotest.fixture
+import idiotest.suite
+import selftest_util
+
+calls = []
+
+@fixture
+def numbers():
+    calls.append('numbers')
+    yield [1, 2, 3]
+    calls.append('teardown')
+
+@fixture(scope='session')
+def reference():
+    return proc.get_output(['echo', 'reference'])
+
+@fixture
+def total(numbers):
+    calls.append('total')
+    return sum(numbers)
+
+@fixture
+def unused():
+    fail("unused fixture should not be evaluated")
+
+@fixture
+def broken():
+    raise ValueError('broken fixture')
+
+@test
+def use_numbers(numbers, total):
+    if total != 6:
+        fail('wrong total: %r' % (total,))
+
+@test
+def cached_value(numbers, total):
+    if calls != ['numbers', 'total']:
+        fail('fixtures evaluated more than once: %r' % (calls,))
+
+@test
+def session_fixture(reference):
+    if reference != 'reference\n':
+        fail()
+
+@test(fail=True)
+def broken_fixture(broken):
+    pass
+
+@test
+def file_fixture(shared_text):
+    if shared_text != 'Test 1 contents\n':
+        fail('wrong value: %r' % (shared_text,))
+
+@test
+def file_fixture_filtered():
+    # Fixture files are loaded even if no other module is selected
+    root = os.path.dirname(os.path.abspath(os.getcwd()))
+    p = subprocess.Popen(
+        [sys.executable, os.path.join(root, 'test.py'),
+         'fixture.file_fixture'],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = p.communicate()[0]
+    if p.returncode != 0 or 'tests passed: 1' not in output:
+        fail('filtered run failed (status %d):\n%s' %
+             (p.returncode, output))
+
+CACHED = '''
+@fixture(inputs=['data.txt'])
+def raw():
+    calls.append('raw')
+    return open('data.txt').read()
+
+@fixture(cache=True)
+def processed(raw):
+    calls.append('processed')
+    return raw.upper()
+
+@test
+def check(processed):
+    results.append(processed)
+'''
+
+fixture(selftest_util.tempdir)
+
+@test
+def cache_dependency(tempdir):
+    path = os.path.join(tempdir, 'cached.py')
+    open(path, 'w').write(CACHED)
+    module = idiotest.suite.Module('cached', path)
+    cache_dir = os.path.join(tempdir, 'cache')
+    def run(data):
+        open(os.path.join(tempdir, 'data.txt'), 'w').write(data)
+        env = {'calls': [], 'results': []}
+        session = idiotest.fixture.Scope('session', cache_dir)
+        module.run(idiotest.suite.Callback(), env, session)
+        return env['calls'], env['results']
+    checks = [
+        ('one\n', ['raw', 'processed'], ['ONE\n']),
+        ('one\n', [], ['ONE\n']),
+        ('two\n', ['raw', 'processed'], ['TWO\n']),
+    ]
+    for data, calls, results in checks:
+        result = run(data)
+        if result != (calls, results):
+            fail('data %r: got %r, expected %r' %
+                 (data, result, (calls, results)))
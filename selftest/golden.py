@@ -0,0 +1,11 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+
+golden_dir('cases', ['cat'])
+
+golden_dir('cases_fail', ['cat'], name='fail', fail=True)
+
+golden_dir('cases', lambda case: ['cat', 'cases/%s.in' % case],
+           name='args', pattern='*.out', output='*.out')
+
+golden_dir('cases_zipped', ['cat'], name='zipped')
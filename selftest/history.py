@@ -0,0 +1,48 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import idiotest.history
+from selftest_util import FakeModule, FakeTest
+import selftest_util
+
+fixture(selftest_util.tempdir)
+
+@test
+def history_drift():
+    steady = [1.0, 1.02, 0.98, 1.01, 0.99] * 4
+    if idiotest.history.drift(steady) is not None:
+        fail('steady durations reported as drifting')
+    slower = [1.2] * 5 + steady
+    result = idiotest.history.drift(slower)
+    if result is None:
+        fail('slower durations not reported')
+    if idiotest.history.drift([1.2] * 5 + [1.0] * 3) is not None:
+        fail('drift reported without enough samples')
+
+@test
+def history_analyze(tempdir):
+    path = os.path.join(tempdir, 'history.sqlite')
+    for i in xrange(30):
+        history = idiotest.history.History(path)
+        slow = FakeTest('slow', duration=2.0 if i >= 25 else 1.0)
+        flaky = FakeTest('flaky', duration=0.1)
+        steady = FakeTest('steady', duration=0.5)
+        for test in (slow, flaky, steady):
+            history.test_begin(test)
+        history.test_pass(slow)
+        history.test_pass(steady)
+        if i % 3:
+            history.test_pass(flaky)
+        else:
+            history.test_fail(flaky, 'failed')
+        history.module_pass(FakeModule())
+        history.close()
+    db = idiotest.history.connect(path)
+    try:
+        drifted, flaky = idiotest.history.analyze(db)
+    finally:
+        db.close()
+    if [x[0] for x in drifted] != ['fake.slow']:
+        fail('wrong drifted tests: %r' % (drifted,))
+    if [x[0] for x in flaky] != ['fake.flaky']:
+        fail('wrong flaky tests: %r' % (flaky,))
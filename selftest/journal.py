@@ -0,0 +1,81 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import idiotest.journal
+import idiotest.suite
+from selftest_util import FakeTest
+import selftest_util
+
+class Record(idiotest.suite.Callback):
+    def __init__(self):
+        self.events = []
+    def test_pass(self, test):
+        self.events.append(('pass', test.name))
+    def test_skip(self, test, reason):
+        self.events.append(('skip', test.name))
+    def test_fail(self, test, reason):
+        self.events.append(('fail', test.name))
+
+fixture(selftest_util.tempdir)
+
+def record_run(path, resume):
+    journal = idiotest.journal.Journal(path, 'abc', resume)
+    journal.test_pass(FakeTest('a'))
+    journal.test_fail(FakeTest('b'), 'broken')
+    journal.test_fail(FakeTest('c', fail=True), 'expected')
+    journal.test_skip(FakeTest('d'), None)
+    journal.test_skip(FakeTest('e', ran=False), None)
+    journal.close()
+
+@test
+def journal_read(tempdir):
+    path = os.path.join(tempdir, 'journal')
+    record_run(path, False)
+    # Simulate a write interrupted by a crash
+    fp = open(path, 'ab')
+    fp.write('{"test": "fake.f", "ok": tr')
+    fp.close()
+    suite, results = idiotest.journal.read(path)
+    if suite != 'abc':
+        fail('wrong fingerprint: %r' % (suite,))
+    expected = {'fake.a': True, 'fake.b': False, 'fake.c': True,
+                'fake.d': False}
+    if results != expected:
+        fail('wrong results: %r' % (results,))
+
+@test
+def journal_resume(tempdir):
+    path = os.path.join(tempdir, 'journal')
+    record_run(path, False)
+    journal = idiotest.journal.Journal(path, 'abc', True)
+    if journal.passed != set(['fake.a', 'fake.c']):
+        fail('wrong passed tests: %r' % (journal.passed,))
+    rec = Record()
+    obj = idiotest.journal.Resume(
+        idiotest.suite.Broadcast([rec, journal]), journal.passed)
+    for test in [FakeTest('a', ran=False), FakeTest('b'),
+                 FakeTest('c', fail=True, ran=False)]:
+        if obj.test_begin(test):
+            obj.test_pass(test)
+        else:
+            obj.test_skip(test, None)
+    journal.close()
+    expected = [('pass', 'a'), ('pass', 'b'), ('fail', 'c')]
+    if rec.events != expected:
+        fail('wrong events: %r' % (rec.events,))
+    if journal.nresumed != 2:
+        fail('wrong number of resumed tests: %d' % (journal.nresumed,))
+    suite, results = idiotest.journal.read(path)
+    if not results['fake.b']:
+        fail('new result not recorded')
+
+@test
+def journal_other_suite(tempdir):
+    path = os.path.join(tempdir, 'journal')
+    record_run(path, False)
+    journal = idiotest.journal.Journal(path, 'def', True)
+    journal.close()
+    if journal.passed:
+        fail('resumed from a different suite')
+    if idiotest.journal.read(path) != ('def', {}):
+        fail('journal not started over')
@@ -0,0 +1,28 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+
+@test
+def memo_reuse():
+    if proc.memo is None:
+        skip('memoization disabled')
+    a = proc.get_output(['date', '+%s.%N'], memo=True)
+    b = proc.get_output(['date', '+%s.%N'], memo=True)
+    if a != b:
+        fail('memoized output differs')
+
+@test
+def memo_input():
+    if proc.memo is None:
+        skip('memoization disabled')
+    a = proc.get_output(['cat'], input='abc', memo=True)
+    b = proc.get_output(['cat'], input='def', memo=True)
+    c = proc.get_output(['cat'], input=file('test1.txt', 'r'), memo=True)
+    if (a, b, c) != ('abc', 'def', 'Test 1 contents\n'):
+        fail('wrong output: %r' % ((a, b, c),))
+
+@test
+def no_memo():
+    a = proc.get_output(['date', '+%s.%N'])
+    b = proc.get_output(['date', '+%s.%N'])
+    if a == b:
+        fail('output should not be memoized')
@@ -0,0 +1,67 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import pstats
+import StringIO
+import sys
+import idiotest.fixture
+import idiotest.profiler
+import idiotest.run
+import idiotest.suite
+import selftest_util
+
+MODULE = '''
+@test
+def busy():
+    sum(range(10000))
+'''
+
+fixture(selftest_util.tempdir)
+
+@test
+def profiler_stats(tempdir):
+    path = os.path.join(tempdir, 'small.py')
+    fp = open(path, 'w')
+    try:
+        fp.write(MODULE)
+    finally:
+        fp.close()
+    outdir = os.path.join(tempdir, 'profile')
+    profiler = idiotest.profiler.Profiler(outdir)
+    module = idiotest.suite.Module('small', path)
+    module.run(profiler, {}, idiotest.fixture.Scope('session'))
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        profiler.print_summary()
+        report = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    for name in ['small.pstats', 'all.pstats']:
+        stats = pstats.Stats(os.path.join(outdir, name))
+        funcs = [func[2] for func in stats.stats]
+        if 'busy' not in funcs:
+            fail('%s does not contain the test function' % (name,))
+    if 'harness hotspots:' not in report:
+        fail('no profile report:\n%s' % (report,))
+
+@test
+def profiler_option():
+    options, args = idiotest.run.parse_args(['--profile', 'sglob'])
+    if options.profile != 'idiotest-profile' or args != ['sglob']:
+        fail('wrong parse: %r %r' % (options.profile, args))
+    stderr = sys.stderr
+    sys.stderr = StringIO.StringIO()
+    try:
+        try:
+            idiotest.run.parse_args(['--profile', '/tmp/profile'])
+        except SystemExit, ex:
+            status = ex.code
+        else:
+            status = None
+        message = sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+    if status != 2 or '--profile=/tmp/profile' not in message:
+        fail('separate value not rejected (status %r):\n%s' %
+             (status, message))
@@ -0,0 +1,88 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import sys
+import subprocess
+import idiotest.proc
+
+@test
+def scratch_write():
+    if proc.scratch is None:
+        skip('scratch mode not enabled')
+    proc.run(['sh', '-c', 'test -f test1.txt && echo x > scratch.out'])
+    if os.path.exists('scratch.out'):
+        fail('program wrote to module directory')
+
+@test
+def scratch_isolated():
+    if proc.scratch is None:
+        skip('scratch mode not enabled')
+    proc.run(['sh', '-c', 'test ! -e scratch.out'])
+    cwd = proc.get_output(['pwd']).strip()
+    if os.path.samefile(cwd, os.getcwd()):
+        fail('program ran in module directory')
+
+@test
+def scratch_modify():
+    if proc.scratch is None:
+        skip('scratch mode not enabled')
+    proc.run(['sh', '-c', 'echo changed >> test1.txt'])
+    proc.check_output(['cat', 'test1.txt'],
+                      output='Test 1 contents\nchanged\n')
+
+@test
+def scratch_original():
+    if proc.scratch is None:
+        skip('scratch mode not enabled')
+    proc.check_output(['cat', 'test1.txt'], output='Test 1 contents\n')
+
+@fixture
+def made():
+    if proc.scratch is None:
+        skip('scratch mode not enabled')
+    proc.run(['sh', '-c', 'echo made > made.txt'])
+
+@fixture(scope='session')
+def echo():
+    if proc.scratch is None:
+        skip('scratch mode not enabled')
+    script = 'while read x; do test "$x" = crash && exit 3; echo "$x"; done'
+    session = proc.session(['sh', '-c', script])
+    yield session
+    session.close()
+
+@test
+def scratch_fixture_file(made):
+    proc.check_output(['cat', 'made.txt'], output='made\n')
+    proc.run(['rm', 'made.txt'])
+
+@test
+def scratch_fixture_file_again(made):
+    proc.check_output(['cat', 'made.txt'], output='made\n')
+
+@test
+def scratch_fixture_crash(echo):
+    echo.check_output('first', output='first')
+    try:
+        echo.request('crash')
+    except idiotest.proc.ProcSessionCrash:
+        pass
+    else:
+        fail('session did not crash')
+
+@test
+def scratch_fixture_restart(echo):
+    echo.check_output('second', output='second')
+
+@test
+def scratch_mode():
+    if proc.scratch is not None:
+        skip('already in scratch mode')
+    root = os.path.dirname(os.path.abspath(os.getcwd()))
+    p = subprocess.Popen(
+        [sys.executable, os.path.join(root, 'test.py'), '--scratch',
+         'scratch'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = p.communicate()[0]
+    if p.returncode != 0 or 'tests passed: 8' not in output:
+        fail('scratch mode run failed (status %d):\n%s' %
+             (p.returncode, output))
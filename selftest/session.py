@@ -0,0 +1,110 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import sys
+import time
+import idiotest.proc
+
+LENGTH_ECHO = '''
+import sys
+import time
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    data = sys.stdin.read(int(line))
+    sys.stdout.write('%d\\n%s' % (len(data), data.upper()))
+    sys.stdout.flush()
+'''
+
+@fixture
+def cat():
+    session = proc.session(['cat'])
+    yield session
+    session.close()
+
+@test
+def line_session(cat):
+    for text in ['abc', 'def', 'ghi']:
+        cat.check_output(text, output=text)
+    if cat.nstart != 1:
+        fail('process started %d times' % (cat.nstart,))
+
+@test(fail=True)
+def line_session_FAIL_DIFF(cat):
+    cat.check_output('abc', output='abd')
+
+@test
+def length_session():
+    session = proc.session([sys.executable, '-c', LENGTH_ECHO],
+                           protocol='length')
+    try:
+        session.check_output('multiple\nlines\n', output='MULTIPLE\nLINES\n')
+        session.check_output('', output='')
+    finally:
+        session.close()
+
+@test
+def crash_restart():
+    script = 'read x; echo "$x"; read y; exit 3'
+    session = proc.session(['sh', '-c', script])
+    try:
+        session.check_output('first', output='first')
+        try:
+            session.request('second')
+        except idiotest.proc.ProcSessionCrash, ex:
+            if ex.retval != 3:
+                fail('wrong exit status: %r' % (ex.retval,))
+        else:
+            fail('session did not crash')
+        session.check_output('third', output='third')
+        if session.crashes != [('second', 3)]:
+            fail('wrong crash record: %r' % (session.crashes,))
+    finally:
+        session.close()
+
+@test
+def large_request(cat):
+    # cat replies while it reads, so the request must not be written
+    # all at once before reading
+    text = 'x' * 300000
+    cat.check_output(text, output=text)
+    cat.check_output('abc', output='abc')
+
+@test
+def crash_error():
+    script = 'read x; echo message >&2; exit 3'
+    session = proc.session(['sh', '-c', script], geterror=True)
+    try:
+        for i in xrange(2):
+            try:
+                session.request('input')
+            except idiotest.proc.ProcSessionCrash, ex:
+                msg = ex.get()
+            else:
+                fail('session did not crash')
+            if 'message' not in msg:
+                fail('error output missing from report:\n%s' % (msg,))
+    finally:
+        session.close()
+    if session.errfile is not None:
+        fail('error file not closed')
+
+@test
+def reply_timeout():
+    script = 'read x; echo "$x"; read y; sleep 30'
+    session = proc.session(['sh', '-c', script], timeout=0.5)
+    try:
+        session.check_output('first', output='first')
+        start = time.time()
+        try:
+            session.request('second')
+        except idiotest.proc.ProcSessionCrash, ex:
+            if ex.retval is not None:
+                fail('wrong exit status: %r' % (ex.retval,))
+        else:
+            fail('session did not time out')
+        if time.time() - start > 10.0:
+            fail('timeout took too long')
+        session.check_output('third', output='third')
+    finally:
+        session.close()
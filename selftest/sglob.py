@@ -0,0 +1,47 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import idiotest.sglob
+
+def check(pats, name, prefix, full):
+    glob = idiotest.sglob.SGlob(pats)
+    if bool(glob.prefix_match(name)) != prefix:
+        fail('prefix_match(%r) with %r should be %r' % (name, pats, prefix))
+    if bool(glob.full_match(name)) != full:
+        fail('full_match(%r) with %r should be %r' % (name, pats, full))
+
+@test
+def literal():
+    check(['demo.test_1'], 'demo', True, False)
+    check(['demo.test_1'], 'demo.test_1', True, True)
+    check(['demo.test_1'], 'demo.test_2', False, False)
+    check(['demo'], 'demo.test_1', True, True)
+
+@test
+def wildcard():
+    check(['demo.test_*'], 'demo.test_1', True, True)
+    check(['demo.test_?'], 'demo.test_10', False, False)
+    check(['d*.test_1'], 'dir2.test_1', True, True)
+    check(['d*'], 'dir2.skipall', True, True)
+
+@test
+def multi():
+    check(['a.**.c'], 'a.b', True, False)
+    check(['a.**.c'], 'a.b.b.c', True, True)
+    check(['a.**.c'], 'a.c', True, True)
+    check(['a.**.c'], 'b.c', False, False)
+
+@test
+def many():
+    pats = ['mod%d.test_%d' % (i, i) for i in xrange(1000)]
+    check(pats, 'mod500.test_500', True, True)
+    check(pats, 'mod500.test_501', False, False)
+
+@test
+def selection():
+    sel = idiotest.sglob.Selection(
+        idiotest.sglob.SGlob(['demo']),
+        idiotest.sglob.SGlob(['demo.test_1']))
+    if not sel.prefix_match('demo') or not sel.prefix_match('demo.test_2'):
+        fail('selection should include demo')
+    if sel.prefix_match('demo.test_1'):
+        fail('selection should exclude demo.test_1')
@@ -0,0 +1,97 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import bz2
+import gzip
+import os
+import shutil
+import StringIO
+import tempfile
+import idiotest.proc
+
+@test
+def stream_compressed():
+    data = ''.join(['line %d\n' % (i,) for i in xrange(50000)])
+    tmpdir = tempfile.mkdtemp()
+    try:
+        inpath = os.path.join(tmpdir, 'input.gz')
+        outpath = os.path.join(tmpdir, 'output.bz2')
+        fp = gzip.GzipFile(inpath, 'wb')
+        fp.write(data)
+        fp.close()
+        fp = bz2.BZ2File(outpath, 'wb')
+        fp.write(data)
+        fp.close()
+        proc.check_output(['cat'], input=proc.open(inpath),
+                          output=proc.open(outpath))
+    finally:
+        shutil.rmtree(tmpdir)
+
+@test
+def stream_report():
+    data = ''.join(['line %d\n' % (i,) for i in xrange(50000)])
+    pos = data.index('line 30000\n')
+    changed = data[:pos] + 'LINE' + data[pos+4:]
+    try:
+        proc.check_output(['cat'], input=StringIO.StringIO(data),
+                          output=StringIO.StringIO(changed))
+    except idiotest.proc.ProcOutputError, ex:
+        msg = ex.get()
+    else:
+        fail('output mismatch not detected')
+    text = 'difference at offset %d (0x%x), line 30001' % (pos, pos)
+    if text not in msg:
+        fail('report does not contain %r:\n%s' % (text, msg))
+    if len(msg) > 4096:
+        fail('report is too long: %d bytes' % (len(msg),))
+
+@test
+def stream_short():
+    data = 'x' * 200000
+    try:
+        proc.check_output(['cat'], input=data,
+                          output=StringIO.StringIO(data + 'extra'))
+    except idiotest.proc.ProcOutputError, ex:
+        msg = ex.get()
+    else:
+        fail('missing output not detected')
+    if 'expected 200005 bytes, got 200000 bytes' not in msg:
+        fail('report does not give the lengths:\n%s' % (msg,))
+
+@test
+def stream_regions():
+    data = ''.join(['line %d\n' % (i,) for i in xrange(50000)])
+    changed = data
+    for i in [1000, 20000, 30000, 40000]:
+        pos = changed.index('line %d\n' % (i,))
+        changed = changed[:pos] + 'LINE' + changed[pos+4:]
+    try:
+        proc.check_output(['cat'], input=StringIO.StringIO(changed),
+                          output=StringIO.StringIO(data))
+    except idiotest.proc.ProcOutputError, ex:
+        msg = ex.get()
+    else:
+        fail('output mismatch not detected')
+    for i in [1000, 20000, 30000]:
+        text = '- line %d\n+ LINE %d\n' % (i, i)
+        if text not in msg:
+            fail('report does not contain %r:\n%s' % (text, msg))
+    if 'line 40000' in msg or msg.count('difference at offset') != 3:
+        fail('report has the wrong differences:\n%s' % (msg,))
+
+@test
+def stream_binary_diff():
+    data = '\x00' * 200000
+    changed = data[:1000] + '\x01' + data[1001:150000] + '\x02' + data[150001:]
+    try:
+        proc.check_output(['cat'], input=StringIO.StringIO(changed),
+                          output=StringIO.StringIO(data))
+    except idiotest.proc.ProcOutputError, ex:
+        msg = ex.get()
+    else:
+        fail('output mismatch not detected')
+    for pos in [1000, 150000]:
+        text = 'difference at offset %d (0x%x), line 1' % (pos, pos)
+        if text not in msg:
+            fail('report does not contain %r:\n%s' % (text, msg))
+    if ' 01 ' not in msg or ' 02 ' not in msg:
+        fail('report does not show the bytes:\n%s' % (msg,))
@@ -0,0 +1,87 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import threading
+import idiotest.stress
+import idiotest.suite
+from selftest_util import FakeModule
+
+@test
+def stress_percentile():
+    values = range(1, 101)
+    for p, expected in [(50, 50), (90, 90), (99, 99), (100, 100), (0, 1)]:
+        result = idiotest.stress.percentile(values, p)
+        if result != expected:
+            fail('percentile %d is %r, expected %r' % (p, result, expected))
+
+@test
+def stress_runs():
+    lock = threading.Lock()
+    calls = []
+    def func():
+        lock.acquire()
+        try:
+            calls.append(idiotest.suite.current_test())
+            n = len(calls)
+        finally:
+            lock.release()
+        if n % 5 == 0:
+            fail('run %d' % (n,))
+    test = idiotest.suite.Test(FakeModule(), 'func', func)
+    result = idiotest.stress.stress_test(test, 40, 4)
+    if (result.npass, result.nfail, result.nskip) != (32, 8, 0):
+        fail('wrong counts: %r' %
+             ((result.npass, result.nfail, result.nskip),))
+    if len(set([id(x) for x in calls])) != 40:
+        fail('test copies were reused')
+    if len(result.latencies) != 40:
+        fail('wrong number of latencies: %d' % (len(result.latencies),))
+
+def stress_with_timeout(test, repeat, concurrency, timeout=60.0):
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(
+            idiotest.stress.stress_test(test, repeat, concurrency)))
+    thread.setDaemon(True)
+    thread.start()
+    thread.join(timeout)
+    if not results:
+        fail('stress test did not finish')
+    return results[0]
+
+@test
+def stress_session():
+    session = proc.session(['cat'])
+    try:
+        counter = iter(xrange(1000000))
+        def func():
+            text = 'request %d' % (counter.next(),)
+            session.check_output(text, output=text)
+        test = idiotest.suite.Test(FakeModule(), 'func', func)
+        result = stress_with_timeout(test, 200, 8)
+    finally:
+        session.close()
+    if result.nfail:
+        fail('concurrent session requests failed:\n%s' % (result.failure,))
+    if session.nstart != 1:
+        fail('session started %d times' % (session.nstart,))
+
+@test
+def stress_skips():
+    lock = threading.Lock()
+    calls = []
+    def func():
+        lock.acquire()
+        try:
+            calls.append(None)
+            n = len(calls)
+        finally:
+            lock.release()
+        if n % 2:
+            skip()
+    test = idiotest.suite.Test(FakeModule(), 'func', func)
+    result = stress_with_timeout(test, 20, 4)
+    if (result.npass, result.nskip) != (10, 10):
+        fail('wrong counts: %r' % ((result.npass, result.nskip),))
+    if len(result.latencies) != 10:
+        fail('skipped runs counted in latencies: %d' %
+             (len(result.latencies),))
@@ -0,0 +1,75 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import os
+import re
+import subprocess
+import sys
+import threading
+import idiotest.timing
+
+Timing = idiotest.timing.Timing
+current = idiotest.timing.current
+
+@test
+def timing_nested():
+    outer = current()
+    with Timing() as a:
+        if current() is not a:
+            fail('outer span is not current')
+        with Timing() as b:
+            if current() is not b:
+                fail('inner span is not current')
+        if current() is not a:
+            fail('outer span not restored')
+    if current() is not outer:
+        fail('test span not restored')
+    if not (a.start <= b.start <= b.end <= a.end):
+        fail('spans do not nest: %r' %
+             ((a.start, b.start, b.end, a.end),))
+
+@test
+def timing_proc():
+    with Timing() as a:
+        with Timing() as b:
+            proc.run(['true'])
+        proc.run(['true'])
+        proc.run(['true'])
+    if (a.nproc, b.nproc) != (2, 1):
+        fail('wrong process counts: %r' % ((a.nproc, b.nproc),))
+    for t in (a, b):
+        if t.spawn <= 0.0 or t.child <= 0.0:
+            fail('process time not recorded: %s' % (t.summary(),))
+        if t.harness < 0.0:
+            fail('negative harness time: %f' % (t.harness,))
+
+@test
+def timing_threads():
+    seen = []
+    def other():
+        seen.append(current())
+        with Timing() as t:
+            seen.append(current() is t)
+    with Timing():
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+    if seen != [None, True]:
+        fail('timing stack shared between threads: %r' % (seen,))
+
+@test
+def timing_durations():
+    root = os.path.dirname(os.path.abspath(os.getcwd()))
+    p = subprocess.Popen(
+        [sys.executable, os.path.join(root, 'test.py'), '--durations=2',
+         'sglob'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = p.communicate()[0]
+    m = re.search(r'^slowest modules:\n((?: .*\n)*)slowest tests:\n'
+                  r'((?: .*\n)*)\n', output, re.M)
+    if p.returncode != 0 or m is None:
+        fail('no durations report (status %d):\n%s' % (p.returncode, output))
+    modules = re.findall(r'^ +[0-9.]+s  (\S+)$', m.group(1), re.M)
+    tests = re.findall(r'^ +[0-9.]+s  (\S+)$', m.group(2), re.M)
+    if modules != ['sglob']:
+        fail('wrong modules listed: %r\n%s' % (modules, output))
+    if len(tests) != 2 or [x for x in tests if not x.startswith('sglob.')]:
+        fail('wrong tests listed: %r\n%s' % (tests, output))
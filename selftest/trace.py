@@ -0,0 +1,29 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+import json
+import os
+import tempfile
+import idiotest.trace
+
+@test
+def trace_bytes():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        tracer = idiotest.trace.Tracer(path)
+        prev = idiotest.trace.tracer
+        idiotest.trace.install(tracer)
+        try:
+            proc.run(['echo', '\xff'])
+            tracer.span('test', 'bad\xff', 0.0, 1.0, {'path': '\xfe'})
+        finally:
+            idiotest.trace.install(prev)
+            tracer.close()
+        events = json.load(open(path))
+    finally:
+        os.unlink(path)
+    if len(events) != 2:
+        fail('expected 2 events, got %d' % (len(events),))
+    args = events[0]['args']['args']
+    if args != [u'echo', u'\ufffd']:
+        fail('wrong process arguments: %r' % (args,))
@@ -0,0 +1,37 @@
+# Copyright 2012 Dietrich Epp <depp@zdome.net>
+# See LICENSE.txt for details.
+"""Shared scaffolding for the IdioTest self tests.
+
+This lives outside the selftest directory so it is not scanned as a
+test module.  Test modules import it, since test.py puts this
+directory on the path.
+"""
+import shutil
+import tempfile
+import idiotest.timing
+
+class FakeModule(object):
+    """A module for passing to callback objects."""
+    name = 'fake'
+
+class FakeTest(object):
+    """A test for passing to callback objects.
+
+    The test ran for 'duration' seconds, unless 'ran' is False.
+    """
+    module = FakeModule()
+
+    def __init__(self, name, fail=False, ran=True, duration=0.0):
+        self.name = name
+        self.fullname = 'fake.' + name
+        self.fail = fail
+        self.timing = idiotest.timing.Timing()
+        if ran:
+            self.timing.start = 0.0
+            self.timing.end = duration
+
+def tempdir():
+    """Fixture for a temporary directory, deleted afterwards."""
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)